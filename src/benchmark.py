@@ -0,0 +1,415 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import logging
+import resource
+import tempfile
+import statistics
+import concurrent.futures
+from datetime import datetime, timedelta
+
+import dblog
+import datamgr
+import historian
+
+# benchmark consts
+BENCH_SIZES = [ 10000 ]
+BENCH_BROWSERS = [ 'firefox', 'chrome' ]
+BENCH_SEED = 1024
+BENCH_BATCH_SIZE = datamgr.datamgr.IMPORT_BATCH_SIZE
+BENCH_SUITES = [ 'import', 'queries' ]
+
+# distinct urls per visit and how strongly visits favour popular urls (zipf exponent)
+BENCH_URLS_PER_VISIT = 0.1
+BENCH_URL_SKEW = 1.1
+BENCH_HOSTS_PER_URL = 0.05
+
+# first synthetic visit, visits are spaced by a random gap up to BENCH_MAX_GAP_SEC
+BENCH_START_TS = 1546300800
+BENCH_MAX_GAP_SEC = 600
+
+# seconds between the unix epoch and chrome's 1601-01-01 epoch
+CHROME_EPOCH_OFFSET_SEC = 11644473600
+
+# a sunday, the query suite seeds every half-hour of the week starting here
+BENCH_QUERY_WEEK = datetime( 2019, 1, 6 )
+
+# pattern the getUrlHistory pattern query is timed with
+BENCH_URL_PATTERN = '%www.example1.com%'
+
+# historian queries the query suite explains, the rest of its queries write the seed cache
+EXPLAIN_QUERIES = [
+    'SQL_SELECT_URL_HISTORY',
+    'SQL_SELECT_URL_HISTORY_PATTERN',
+    'SQL_SELECT_URL_HISTORY_RANGE',
+    'SQL_SELECT_NEXT_URLS',
+    'SQL_SELECT_DOW_URL_DATA',
+    'SQL_SELECT_HALF_HOUR_URL_DATA',
+    'SQL_SELECT_BUCKET_TOTALS',
+    'SQL_SELECT_HALF_HOURS_URL_DATA',
+    'SQL_SELECT_DAY_TOTALS',
+    'SQL_SELECT_SEED_CACHE'
+]
+
+# a query plan step that reads every row of a table or index, instead of searching one by key. scans of
+# a subquery only read the rows the subquery already searched
+FULL_SCAN_PLAN = re.compile( r'^SCAN (?!\(subquery-|SUBQUERY )' )
+
+# source database schemas, only the columns browsers define that importdb or the generator touch matter
+SQL_CREATE_FIREFOX = '''
+    CREATE TABLE moz_places (
+        id INTEGER PRIMARY KEY,
+        url LONGVARCHAR,
+        title LONGVARCHAR,
+        rev_host LONGVARCHAR,
+        visit_count INTEGER DEFAULT 0,
+        hidden INTEGER DEFAULT 0 NOT NULL,
+        typed INTEGER DEFAULT 0 NOT NULL,
+        frecency INTEGER DEFAULT -1 NOT NULL,
+        last_visit_date INTEGER,
+        guid TEXT
+    );
+    CREATE TABLE moz_historyvisits (
+        id INTEGER PRIMARY KEY,
+        from_visit INTEGER,
+        place_id INTEGER,
+        visit_date INTEGER,
+        visit_type INTEGER,
+        session INTEGER
+    );
+    '''
+
+SQL_CREATE_CHROME = '''
+    CREATE TABLE urls (
+        id INTEGER PRIMARY KEY,
+        url LONGVARCHAR,
+        title LONGVARCHAR,
+        visit_count INTEGER DEFAULT 0 NOT NULL,
+        typed_count INTEGER DEFAULT 0 NOT NULL,
+        last_visit_time INTEGER NOT NULL,
+        hidden INTEGER DEFAULT 0 NOT NULL
+    );
+    CREATE TABLE visits (
+        id INTEGER PRIMARY KEY,
+        url INTEGER NOT NULL,
+        visit_time INTEGER NOT NULL,
+        from_visit INTEGER,
+        transition INTEGER DEFAULT 0 NOT NULL,
+        segment_id INTEGER,
+        visit_duration INTEGER DEFAULT 0 NOT NULL
+    );
+    '''
+
+SQL_INSERT_FIREFOX_PLACE = 'INSERT INTO moz_places (id,url,title,rev_host,visit_count,last_visit_date) VALUES (?,?,?,?,?,?)'
+SQL_INSERT_FIREFOX_VISIT = 'INSERT INTO moz_historyvisits (id,from_visit,place_id,visit_date,visit_type,session) VALUES (?,?,?,?,?,0)'
+SQL_INSERT_CHROME_URL = 'INSERT INTO urls (id,url,title,visit_count,last_visit_time) VALUES (?,?,?,?,?)'
+SQL_INSERT_CHROME_VISIT = 'INSERT INTO visits (id,url,visit_time,from_visit,transition) VALUES (?,?,?,?,?)'
+
+# firefox visit types (link, typed, bookmark) and chrome core transitions (link, typed, auto_bookmark)
+# with the chain-start/end qualifiers chrome stores in the upper bits
+FIREFOX_VISIT_TYPES = [ 1, 2, 3 ]
+CHROME_TRANSITIONS = [ 0x30000000, 0x30000001, 0x30000002 ]
+VISIT_TYPE_WEIGHTS = [ 80, 15, 5 ]
+
+def log( msg, level = logging.INFO ):
+    """
+    Log a benchmark message
+    """
+    dblog.log( 'bench', msg, level )
+
+def hostName( urlId, hosts ):
+    """
+    Synthetic host for a url id, urls are spread across a smaller set of hosts
+    """
+    return 'www.example%d.com' % ( urlId % hosts )
+
+def urlName( urlId, hosts ):
+    """
+    Synthetic url for a url id
+    """
+    return 'https://%s/page/%d?id=%d' % ( hostName( urlId, hosts ), urlId // hosts, urlId )
+
+def genVisits( visits, urls, rng ):
+    """
+    Yields ( visit id, url id, unix time, from visit, type index ) for synthetic visits,
+    url ids follow a zipf distribution so popular urls are revisited like real history
+    """
+    cumWeights = [ ]
+    total = 0.0
+    for rank in range( urls ):
+        total += 1.0 / ( ( rank + 1 ) ** BENCH_URL_SKEW )
+        cumWeights.append( total )
+
+    # shuffle which ids are popular so hot urls aren't all on the first pages of the url table
+    urlIds = list( range( 1, urls + 1 ) )
+    rng.shuffle( urlIds )
+
+    ts = BENCH_START_TS
+    visitId = 1
+    while visitId <= visits:
+        count = min( BENCH_BATCH_SIZE, visits - visitId + 1 )
+        ranks = rng.choices( range( urls ), cum_weights = cumWeights, k = count )
+        types = rng.choices( range( len( VISIT_TYPE_WEIGHTS ) ), weights = VISIT_TYPE_WEIGHTS, k = count )
+        for i in range( count ):
+            ts += rng.randint( 1, BENCH_MAX_GAP_SEC )
+            fromVisit = visitId - 1 if types[ i ] == 0 and visitId > 1 else 0
+            yield ( visitId, urlIds[ ranks[ i ] ], ts, fromVisit, types[ i ] )
+            visitId += 1
+
+def genBrowserDatabase( browser, filename, visits, seed = BENCH_SEED ):
+    """
+    Create a synthetic firefox (places.sqlite) or chrome (History) database with a number of visits
+    """
+    rng = random.Random( seed )
+    urls = max( 1, int( visits * BENCH_URLS_PER_VISIT ) )
+    hosts = max( 1, int( urls * BENCH_HOSTS_PER_URL ) )
+    firefox = browser == 'firefox'
+
+    if os.path.exists( filename ):
+        os.remove( filename )
+    conn = sqlite3.connect( filename )
+    conn.execute( 'PRAGMA journal_mode = OFF' )
+    conn.execute( 'PRAGMA synchronous = OFF' )
+    conn.executescript( SQL_CREATE_FIREFOX if firefox else SQL_CREATE_CHROME )
+
+    counts = [ 0 ] * ( urls + 1 )
+    lastVisit = [ 0 ] * ( urls + 1 )
+    batch = [ ]
+    for ( visitId, urlId, ts, fromVisit, typeIdx ) in genVisits( visits, urls, rng ):
+        counts[ urlId ] += 1
+        if firefox:
+            visitTime = ts * 1000000
+            batch.append( ( visitId, fromVisit, urlId, visitTime, FIREFOX_VISIT_TYPES[ typeIdx ] ) )
+        else:
+            visitTime = ( ts + CHROME_EPOCH_OFFSET_SEC ) * 1000000
+            batch.append( ( visitId, urlId, visitTime, fromVisit, CHROME_TRANSITIONS[ typeIdx ] ) )
+        lastVisit[ urlId ] = visitTime
+
+        if len( batch ) >= BENCH_BATCH_SIZE:
+            conn.executemany( SQL_INSERT_FIREFOX_VISIT if firefox else SQL_INSERT_CHROME_VISIT, batch )
+            batch = [ ]
+    if batch:
+        conn.executemany( SQL_INSERT_FIREFOX_VISIT if firefox else SQL_INSERT_CHROME_VISIT, batch )
+
+    # urls/places are written last, once their visit counts are known
+    if firefox:
+        # firefox stores hosts reversed with a trailing dot in rev_host
+        rows = ( ( urlId, urlName( urlId, hosts ), 'Page %d' % urlId, hostName( urlId, hosts )[ ::-1 ] + '.',
+                   counts[ urlId ], lastVisit[ urlId ] or None )
+                 for urlId in range( 1, urls + 1 ) )
+        conn.executemany( SQL_INSERT_FIREFOX_PLACE, rows )
+    else:
+        rows = ( ( urlId, urlName( urlId, hosts ), 'Page %d' % urlId, counts[ urlId ], lastVisit[ urlId ] )
+                 for urlId in range( 1, urls + 1 ) )
+        conn.executemany( SQL_INSERT_CHROME_URL, rows )
+
+    conn.commit( )
+    conn.close( )
+
+def peakRssKb( ):
+    """
+    Peak resident set size of this process in KB
+    """
+    peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    # macOS reports bytes, linux reports KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def buildCase( browser, visits, workdir, seed = BENCH_SEED ):
+    """
+    Generate a browser database, import it and rebuild working history,
+    returning the history database's data manager and the measurements
+    """
+    sourceFile = os.path.join( workdir, '%s-%d.sqlite' % ( browser, visits ) )
+    historyFile = os.path.join( workdir, 'history-%s-%d.sqlite' % ( browser, visits ) )
+    for filename in ( historyFile, historyFile + '-wal', historyFile + '-shm' ):
+        if os.path.exists( filename ):
+            os.remove( filename )
+
+    tick = time.time( )
+    genBrowserDatabase( browser, sourceFile, visits, seed )
+    genSec = time.time( ) - tick
+
+    dataMgr = datamgr.datamgr( None )
+    dataMgr.initDb( historyFile )
+
+    tick = time.time( )
+    dataMgr.importDatabase( browser, sourceFile, rebuild = False )
+    importSec = time.time( ) - tick
+    dataMgr.executeSql( 'SELECT count(*) FROM imported_history' )
+    importedRows = dataMgr.curs( ).fetchone( )[ 0 ]
+
+    tick = time.time( )
+    dataMgr.rebuildUrlHistoryTable( )
+    rebuildSec = time.time( ) - tick
+
+    dataMgr.executeSql( 'SELECT count(*) FROM history' )
+    historyRows = dataMgr.curs( ).fetchone( )[ 0 ]
+    dataMgr.conn( ).execute( 'PRAGMA wal_checkpoint( TRUNCATE )' )
+
+    return dataMgr, {
+        'browser': browser,
+        'visits': visits,
+        'imported_rows': importedRows,
+        'history_rows': historyRows,
+        'generate_sec': round( genSec, 3 ),
+        'import_sec': round( importSec, 3 ),
+        'import_rows_per_sec': round( visits / importSec ) if importSec else None,
+        'rebuild_sec': round( rebuildSec, 3 ),
+        'rebuild_rows_per_sec': round( visits / rebuildSec ) if rebuildSec else None,
+        'source_db_bytes': os.path.getsize( sourceFile ),
+        'history_db_bytes': os.path.getsize( historyFile )
+    }
+
+def lostVisits( result ):
+    """
+    True if a case's import or rebuild lost generated visits, every one has its own url and time
+    """
+    return result[ 'imported_rows' ] != result[ 'visits' ] or result[ 'history_rows' ] != result[ 'visits' ]
+
+def runCase( browser, visits, workdir, seed = BENCH_SEED ):
+    """
+    Benchmark importing a generated browser database, returning the measurements
+    """
+    ( dataMgr, result ) = buildCase( browser, visits, workdir, seed )
+    dataMgr.closeConn( )
+    result[ 'peak_rss_kb' ] = peakRssKb( )
+
+    return result
+
+def explainQueries( dataMgr ):
+    """
+    Returns the EXPLAIN QUERY PLAN steps of each historian query, and the names of queries that scan a whole table
+    """
+    plans = { }
+    fullScans = [ ]
+    for name in EXPLAIN_QUERIES:
+        sql = getattr( historian.historian, name )
+        # plans don't depend on the values, only on which parameters are bound
+        rows = dataMgr.conn( ).execute( 'EXPLAIN QUERY PLAN ' + sql, ( None, ) * sql.count( '?' ) ).fetchall( )
+        plans[ name ] = [ row[ 'detail' ] for row in rows ]
+        if any( FULL_SCAN_PLAN.match( step ) for step in plans[ name ] ):
+            fullScans.append( name )
+
+    return plans, fullScans
+
+def timeCalls( func, argsList ):
+    """
+    Call func with each args tuple, returning call timing stats in milliseconds
+    """
+    times = [ ]
+    for args in argsList:
+        tick = time.perf_counter( )
+        func( *args )
+        times.append( ( time.perf_counter( ) - tick ) * 1000 )
+    times.sort( )
+
+    return {
+        'calls': len( times ),
+        'total_ms': round( sum( times ), 3 ),
+        'mean_ms': round( statistics.mean( times ), 3 ),
+        'p95_ms': round( times[ int( 0.95 * ( len( times ) - 1 ) ) ], 3 ),
+        'max_ms': round( times[ -1 ], 3 )
+    }
+
+def runQueryCase( browser, visits, workdir, seed = BENCH_SEED ):
+    """
+    Benchmark the historian's entry points over every day-of-week / half-hour slot
+    of a generated and imported browser database, returning the measurements and query plans
+    """
+    ( dataMgr, result ) = buildCase( browser, visits, workdir, seed )
+    hist = historian.historian( None, random.Random( seed ), dataMgr )
+
+    slots = [ BENCH_QUERY_WEEK + timedelta( minutes = 30 * i ) for i in range( 7 * 48 ) ]
+    historyDays = ( datetime.now( ) - datetime.fromtimestamp( BENCH_START_TS ) ).days + 1
+
+    # the rebuild emptied the seed cache, seed data is timed without it first, then with every slot cached
+    hist.SEED_CACHE_SLOTS = len( slots )
+    result[ 'queries' ] = {
+        'getDoWUrlData': timeCalls( hist.getDoWUrlData, [ ( dtm.isoweekday( ) % 7, ) for dtm in slots ] ),
+        'getHalfHrlyUrlData': timeCalls( hist.getHalfHrlyUrlData, [ ( dtm.hour, dtm.minute ) for dtm in slots ] ),
+        'getSeedUrlData': timeCalls( hist.getSeedUrlData, [ ( dtm, ) for dtm in slots ] ),
+        'getSeedUrlData_cached': timeCalls( hist.getSeedUrlData, [ ( dtm, ) for dtm in slots ] ),
+        'getUrlHistory': timeCalls( hist.getUrlHistory, [ ( historyDays, ) ] ),
+        'getUrlHistory_pattern': timeCalls( hist.getUrlHistory, [ ( historyDays, BENCH_URL_PATTERN ) ] )
+    }
+    ( result[ 'query_plans' ], result[ 'full_scans' ] ) = explainQueries( dataMgr )
+    result[ 'peak_rss_kb' ] = peakRssKb( )
+    dataMgr.closeConn( )
+
+    return result
+
+def runBenchmark( browsers = BENCH_BROWSERS, sizes = BENCH_SIZES, workdir = None, seed = BENCH_SEED, suite = 'import' ):
+    """
+    Run every browser/size case of a suite in its own process, so peak RSS is measured per case,
+    yielding each case's measurements as it finishes
+    """
+    caseFunc = runQueryCase if suite == 'queries' else runCase
+    keep = workdir is not None
+    workdir = workdir or tempfile.mkdtemp( prefix = 'dirtyboots-bench-' )
+    os.makedirs( workdir, exist_ok = True )
+    try:
+        for visits in sizes:
+            for browser in browsers:
+                log( 'Benchmarking %s %s of %d visits' % ( browser, suite, visits ) )
+                with concurrent.futures.ProcessPoolExecutor( max_workers = 1 ) as executor:
+                    result = executor.submit( caseFunc, browser, visits, workdir, seed ).result( )
+                result[ 'suite' ] = suite
+                log( '%d rows/sec import, %d rows/sec rebuild, %d KB peak RSS' % (
+                     result[ 'import_rows_per_sec' ] or 0, result[ 'rebuild_rows_per_sec' ] or 0, result[ 'peak_rss_kb' ] ) )
+                if lostVisits( result ):
+                    log( 'Imported %d and rebuilt %d of %d %s visits' % ( result[ 'imported_rows' ],
+                         result[ 'history_rows' ], visits, browser ), logging.ERROR )
+                for name in result.get( 'full_scans', [ ] ):
+                    log( 'Query %s scans a full table: %s' % ( name, '; '.join( result[ 'query_plans' ][ name ] ) ),
+                         logging.ERROR )
+                yield result
+    finally:
+        if not keep:
+            shutil.rmtree( workdir, ignore_errors = True )
+
+def main( argv = None ):
+    """
+    Parse CLI args and print one JSON object per benchmark case, exits with 1 if a case lost visits
+    while importing or a historian query scans a full table
+    """
+    parser = argparse.ArgumentParser( prog = 'benchmark', description = 'Benchmark importing and querying synthetic browser databases',
+                                      formatter_class = argparse.ArgumentDefaultsHelpFormatter )
+    parser.add_argument( '--suite', action = 'store', choices = BENCH_SUITES, default = 'import',
+                         help = 'Benchmark importing databases, or historian queries over every day-of-week / half-hour slot' )
+    parser.add_argument( '--sizes', action = 'store', nargs = '+', type = int, default = BENCH_SIZES,
+                         help = 'Number of visits per generated database, ex: 10000 1000000 10000000' )
+    parser.add_argument( '--browsers', action = 'store', nargs = '+', choices = BENCH_BROWSERS, default = BENCH_BROWSERS,
+                         help = 'Browser database types to generate' )
+    parser.add_argument( '--seed', action = 'store', type = int, default = BENCH_SEED,
+                         help = 'Random seed for generated visits' )
+    parser.add_argument( '--workdir', action = 'store', default = None,
+                         help = 'Directory to keep generated databases in, a removed temp dir if not set' )
+    parser.add_argument( '--output', action = 'store', default = None,
+                         help = 'File to append JSON results to, stdout if not set' )
+    parser.add_argument( '--level', action = 'store', default = 'warning',
+                         choices = [ 'debug', 'info', 'warning', 'error', 'critical' ], help = 'Logging level' )
+    args = parser.parse_args( argv )
+
+    logging.basicConfig( format = '%(message)s', level = getattr( logging, args.level.upper( ) ) )
+    out = open( args.output, 'a' ) if args.output else sys.stdout
+    failures = 0
+    try:
+        for result in runBenchmark( args.browsers, args.sizes, args.workdir, args.seed, args.suite ):
+            out.write( json.dumps( result, sort_keys = True ) + '\n' )
+            out.flush( )
+            failures += len( result.get( 'full_scans', [ ] ) ) + lostVisits( result )
+    finally:
+        if args.output:
+            out.close( )
+
+    if failures:
+        sys.exit( 1 )
+
+if __name__ == "__main__":
+    main( )
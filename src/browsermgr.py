@@ -0,0 +1,165 @@
+import time
+import logging
+import collections
+
+import dblog
+
+# psutil is optional, without it browsers aren't recycled for memory use
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+class browsermgr( object ):
+    """
+    Lifecycle of one browser: started when first needed and reused between pages, recycled after
+    too many pages, too much memory or slowing page loads, and respawned when its driver dies
+    """
+    # recent page loads averaged for the page load limit
+    LOAD_WINDOW = 20
+
+    # pages between memory checks, walking the browser's processes isn't free
+    RSS_CHECK_PAGES = 10
+
+    def __init__( self, browserName, createFunc, maxPages = 0, maxRssMb = 0, maxLoadSec = 0 ):
+        self.browserName = browserName
+        self.createFunc = createFunc
+        self.maxPages = maxPages
+        self.maxRssMb = maxRssMb
+        self.maxLoadSec = maxLoadSec
+        self.instance = None
+        self.pages = 0
+        self.loads = collections.deque( maxlen = self.LOAD_WINDOW )
+        self.rssMb = None
+        self.pageLoadTimeout = None
+        self.restarts = collections.Counter( )
+
+    def log( self, msg, level = logging.INFO ):
+        """
+        Shortcut to DB's logger
+        """
+        dblog.log( 'browser', msg, level = level )
+
+    def driver( self ):
+        """
+        Returns the webdriver, starting the browser if it isn't running
+        """
+        if self.instance is None:
+            self.start( )
+
+        return self.instance
+
+    def start( self ):
+        """
+        Start a new browser and reset its counters
+        """
+        tick = time.time( )
+        self.instance = self.createFunc( self.browserName )
+        self.pages = 0
+        self.loads.clear( )
+        self.rssMb = None
+        self.pageLoadTimeout = None
+        self.log( 'Started %s in %.2fs' % ( self.browserName, time.time( ) - tick ) )
+
+    def quit( self ):
+        """
+        Quit the browser, a driver that already died is just dropped
+        """
+        if self.instance is None:
+            return
+
+        try:
+            self.instance.quit( )
+        except Exception as e:
+            self.log( 'Unable to quit %s cleanly: %s' % ( self.browserName, e ), level = logging.WARNING )
+        self.instance = None
+
+    def restart( self, reason ):
+        """
+        Replace the browser with a new one, counting the restart under reason
+        """
+        self.log( 'Restarting %s (%s) after %d pages, %s MB, %.2fs mean load' % (
+            self.browserName, reason, self.pages, self.rssMb if self.rssMb is not None else '?', self.meanLoadSec( ) ) )
+        self.quit( )
+        self.restarts[ reason ] += 1
+        self.start( )
+
+    def setPageLoadTimeout( self, seconds ):
+        """
+        Set the driver's page load timeout, skipping the driver call when it's already set
+        """
+        if seconds != self.pageLoadTimeout:
+            self.driver( ).set_page_load_timeout( seconds )
+            self.pageLoadTimeout = seconds
+
+    def pageLoaded( self, loadSec ):
+        """
+        Record a page load, and every RSS_CHECK_PAGES pages the browser's memory use
+        """
+        self.pages += 1
+        self.loads.append( loadSec )
+        if self.maxRssMb and self.pages % self.RSS_CHECK_PAGES == 0:
+            self.rssMb = self.measureRssMb( )
+
+    def meanLoadSec( self ):
+        """
+        Mean of the recent page loads
+        """
+        return sum( self.loads ) / len( self.loads ) if self.loads else 0
+
+    def recycleReason( self ):
+        """
+        Returns why the browser should be recycled, or None while it is within its limits
+        """
+        if self.maxPages and self.pages >= self.maxPages:
+            return 'pages'
+        if self.maxRssMb and self.rssMb is not None and self.rssMb >= self.maxRssMb:
+            return 'memory'
+        if self.maxLoadSec and len( self.loads ) == self.LOAD_WINDOW and self.meanLoadSec( ) >= self.maxLoadSec:
+            return 'latency'
+
+        return None
+
+    def recycleIfNeeded( self ):
+        """
+        Recycle a running browser that is past its limits, returns True if it was restarted
+        """
+        reason = self.recycleReason( ) if self.instance is not None else None
+        if reason:
+            self.restart( reason )
+
+        return reason is not None
+
+    def alive( self ):
+        """
+        True if the driver still answers, a page error leaves it alive while a crash doesn't
+        """
+        if self.instance is None:
+            return False
+
+        try:
+            self.instance.current_url
+            return True
+        except Exception:
+            return False
+
+    def measureRssMb( self ):
+        """
+        Resident memory of the driver and the browser processes it started, None if it can't be measured
+        """
+        if psutil is None:
+            return None
+
+        try:
+            driverProc = psutil.Process( self.instance.service.process.pid )
+            procs = [ driverProc ] + driverProc.children( recursive = True )
+            rss = 0
+            for proc in procs:
+                try:
+                    rss += proc.memory_info( ).rss
+                except psutil.Error:
+                    pass
+        except ( AttributeError, psutil.Error ):
+            return None
+
+        return round( rss / ( 1024 * 1024 ), 1 )
@@ -17,6 +17,19 @@ class conf( ):
     OPTION_TYPING_WPM = 'TypingWPM'
     OPTION_TYPING_ERR = 'TypingErrRate'
     OPTION_WINDOW_DAYS = 'HistoryWindowDays'
+    OPTION_SEED_ENGINE = 'SeedEngine'
+    OPTION_WORKERS = 'Workers'
+    OPTION_IMPORT_WORKERS = 'ImportWorkers'
+    OPTION_VISIT_BACKEND = 'VisitBackend'
+    OPTION_FETCH_RESOURCES = 'FetchResources'
+    OPTION_BROWSERLIST = 'BrowserListFile'
+    OPTION_BROWSER_MAX_PAGES = 'BrowserMaxPages'
+    OPTION_BROWSER_MAX_RSS = 'BrowserMaxRssMb'
+    OPTION_BROWSER_MAX_LOAD = 'BrowserMaxLoadSec'
+    OPTION_PAGE_LOAD_STRATEGY = 'PageLoadStrategy'
+    OPTION_VISIT_TIMEOUT = 'VisitTimeoutSec'
+    OPTION_DEADLINELIST = 'DeadlineListFile'
+    OPTION_COORDINATOR_LISTEN = 'CoordinatorListen'
     OPTION_BLACKLIST   = 'BlackListFile'
     OPTION_WHITELIST   = 'WhiteListFile'
 
@@ -33,6 +46,19 @@ class conf( ):
     OPTION_TYPING_WPM_DEFAULT = 80
     OPTION_TYPING_ERR_DEFAULT = .15
     OPTION_WINDOW_DAYS_DEFAULT = 31
+    OPTION_SEED_ENGINE_DEFAULT = 'auto'
+    OPTION_WORKERS_DEFAULT = 1
+    OPTION_IMPORT_WORKERS_DEFAULT = 0
+    OPTION_VISIT_BACKEND_DEFAULT = 'browser'
+    OPTION_FETCH_RESOURCES_DEFAULT = True
+    OPTION_BROWSERLIST_DEFAULT = 'browserlist.txt'
+    OPTION_BROWSER_MAX_PAGES_DEFAULT = 500
+    OPTION_BROWSER_MAX_RSS_DEFAULT = 2048
+    OPTION_BROWSER_MAX_LOAD_DEFAULT = 20
+    OPTION_PAGE_LOAD_STRATEGY_DEFAULT = 'normal'
+    OPTION_VISIT_TIMEOUT_DEFAULT = 30
+    OPTION_DEADLINELIST_DEFAULT = 'deadlines.txt'
+    OPTION_COORDINATOR_LISTEN_DEFAULT = 'localhost:8642'
     OPTION_BLACKLIST_DEFAULT = 'blacklist.txt'
     OPTION_WHITELIST_DEFAULT = 'whitelist.txt'
 
@@ -74,6 +100,19 @@ class conf( ):
             self.OPTION_TYPING_WPM: self.OPTION_TYPING_WPM_DEFAULT,
             self.OPTION_TYPING_ERR: self.OPTION_TYPING_ERR_DEFAULT,
             self.OPTION_WINDOW_DAYS: self.OPTION_WINDOW_DAYS_DEFAULT,
+            self.OPTION_SEED_ENGINE: self.OPTION_SEED_ENGINE_DEFAULT,
+            self.OPTION_WORKERS: self.OPTION_WORKERS_DEFAULT,
+            self.OPTION_IMPORT_WORKERS: self.OPTION_IMPORT_WORKERS_DEFAULT,
+            self.OPTION_VISIT_BACKEND: self.OPTION_VISIT_BACKEND_DEFAULT,
+            self.OPTION_FETCH_RESOURCES: self.OPTION_FETCH_RESOURCES_DEFAULT,
+            self.OPTION_BROWSERLIST: self.OPTION_BROWSERLIST_DEFAULT,
+            self.OPTION_BROWSER_MAX_PAGES: self.OPTION_BROWSER_MAX_PAGES_DEFAULT,
+            self.OPTION_BROWSER_MAX_RSS: self.OPTION_BROWSER_MAX_RSS_DEFAULT,
+            self.OPTION_BROWSER_MAX_LOAD: self.OPTION_BROWSER_MAX_LOAD_DEFAULT,
+            self.OPTION_PAGE_LOAD_STRATEGY: self.OPTION_PAGE_LOAD_STRATEGY_DEFAULT,
+            self.OPTION_VISIT_TIMEOUT: self.OPTION_VISIT_TIMEOUT_DEFAULT,
+            self.OPTION_DEADLINELIST: self.OPTION_DEADLINELIST_DEFAULT,
+            self.OPTION_COORDINATOR_LISTEN: self.OPTION_COORDINATOR_LISTEN_DEFAULT,
             self.OPTION_WHITELIST: self.OPTION_WHITELIST_DEFAULT,
             self.OPTION_BLACKLIST: self.OPTION_BLACKLIST_DEFAULT,
         }
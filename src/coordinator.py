@@ -0,0 +1,359 @@
+import os
+import json
+import time
+import queue
+import random
+import socket
+import logging
+import threading
+import collections
+import socketserver
+import concurrent.futures
+from datetime import datetime
+
+import dblog
+
+def parseAddress( address ):
+    """
+    Parse a "host:port" or "unix:/path" address into a ( socket family, address ) pair
+    """
+    if address.startswith( 'unix:' ):
+        return socket.AF_UNIX, address[ len( 'unix:' ): ]
+
+    ( host, _, port ) = address.rpartition( ':' )
+    if not port.isdigit( ):
+        raise ValueError( 'coordinator address must be host:port or unix:/path, not [ %s ]' % address )
+
+    return socket.AF_INET, ( host or 'localhost', int( port ) )
+
+class coordinatorHandler( socketserver.StreamRequestHandler ):
+    """
+    Answers one JSON request line from a node with one JSON response line. Each connection is read on
+    its own thread, so a slow node doesn't hold up the others
+    """
+    # seconds a node may take to send its request
+    timeout = 10
+
+    def handle( self ):
+        try:
+            line = self.rfile.readline( coordinator.MAX_REQUEST_BYTES )
+        except OSError:
+            return
+
+        try:
+            request = json.loads( line )
+        except ( ValueError, RecursionError ):
+            request = None
+
+        response = self.server.coordinator.ask( request )
+        try:
+            self.wfile.write( ( json.dumps( response ) + '\n' ).encode( ) )
+        except OSError:
+            pass
+
+# connections waiting to be accepted, the default of 5 refuses nodes that connect at once
+LISTEN_BACKLOG = 128
+
+class tcpServer( socketserver.ThreadingMixIn, socketserver.TCPServer ):
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+class unixServer( socketserver.ThreadingMixIn, socketserver.UnixStreamServer ):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+class coordinator( object ):
+    """
+    Owns the history database, the seed data and the browsing rate of several nodes. Visit times are spaced
+    by one global rate, and nodes lease batches of urls with their visit times, so nodes add throughput
+    while their combined traffic still follows the history
+    """
+    # length of a seed window
+    WINDOW_SEC = 1800
+
+    # visit times are leased at most this far ahead, so a slow node doesn't sit on urls others could visit
+    LEASE_AHEAD_SEC = 30
+
+    # most urls in one lease
+    MAX_LEASE_URLS = 50
+
+    # seconds after its last visit time a lease that wasn't reported is expired
+    LEASE_GRACE_SEC = 300
+
+    # seconds a node waits before leasing again when there are no urls to browse
+    EMPTY_RETRY_SEC = 60
+
+    MAX_REQUEST_BYTES = 64 * 1024
+
+    # fields of each op's request with their types, ints are counts or ids and can't be negative
+    REQUEST_FIELDS = {
+        'lease':  { 'node': str, 'max': int },
+        'report': { 'lease': int, 'visited': int, 'failed': int, 'returned': list },
+        'stats':  { }
+    }
+
+    # errors sent back to nodes
+    ERROR_BAD_REQUEST = 'bad request'
+    ERROR_UNKNOWN_OP = 'unknown op'
+    ERROR_FAILED = 'request failed'
+
+    def __init__( self, historian, rng = None ):
+        self.historian = historian
+        self.rng = rng or random.Random( )
+        self.urlRows = [ ]
+        self.seedLen = 0
+        self.expires = None
+        self.secPerUrl = 0
+        self.nextSlot = 0
+        self.leases = { }
+        self.leaseId = 0
+        self.nodes = { }
+        self.stats = collections.Counter( )
+        self.requests = queue.Queue( )
+
+    def log( self, msg, level = logging.INFO ):
+        """
+        Shortcut to DB's logger
+        """
+        dblog.log( 'coord', msg, level = level )
+
+    def serve( self, address ):
+        """
+        Answer nodes on a "host:port" or "unix:/path" address until interrupted. Connections are read on
+        the server's threads, while requests are answered one at a time on this thread, which keeps the
+        historian's connection on the thread that opened it
+        """
+        ( family, addr ) = parseAddress( address )
+        if family == socket.AF_UNIX:
+            if os.path.exists( addr ):
+                os.unlink( addr )
+            server = unixServer( addr, coordinatorHandler )
+        else:
+            server = tcpServer( addr, coordinatorHandler )
+
+        server.coordinator = self
+        serverThread = threading.Thread( target = server.serve_forever, name = 'coordinator-server', daemon = True )
+        serverThread.start( )
+        self.log( 'Coordinating nodes on %s' % address )
+        try:
+            while True:
+                ( request, answer ) = self.requests.get( )
+                answer.set_result( self.respond( request ) )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown( )
+            server.server_close( )
+            if family == socket.AF_UNIX and os.path.exists( addr ):
+                os.unlink( addr )
+
+        self.log( 'Stopped coordinating %d nodes: %d leased, %d visited, %d failed, %d returned, %d expired' % (
+            len( self.nodes ), self.stats[ 'leased' ], self.stats[ 'visited' ], self.stats[ 'failed' ],
+            self.stats[ 'returned' ], self.stats[ 'expired' ] ) )
+
+    def ask( self, request ):
+        """
+        Server thread: hand a request to the serving thread and wait for its response
+        """
+        answer = concurrent.futures.Future( )
+        self.requests.put( ( request, answer ) )
+
+        return answer.result( )
+
+    def respond( self, request ):
+        """
+        Dispatch a request, nodes get a fixed error when it fails, never the text of an exception
+        """
+        try:
+            return self.dispatch( request )
+        except Exception as e:
+            self.log( 'Failed to answer %s: %s' % ( request[ 'op' ], e ), level = logging.ERROR )
+            return { 'error': self.ERROR_FAILED }
+
+    def dispatch( self, request ):
+        """
+        Route a node's request to its operation, returns the response or an error for a malformed request
+        """
+        if not isinstance( request, dict ) or not isinstance( request.get( 'op' ), str ):
+            return { 'error': self.ERROR_BAD_REQUEST }
+
+        op = request[ 'op' ]
+        if op not in self.REQUEST_FIELDS:
+            return { 'error': self.ERROR_UNKNOWN_OP }
+
+        if op == 'report':
+            request.setdefault( 'returned', [ ] )
+
+        if not self.validRequest( request, self.REQUEST_FIELDS[ op ] ):
+            return { 'error': self.ERROR_BAD_REQUEST }
+
+        if op == 'lease':
+            return self.lease( request[ 'node' ], request[ 'max' ] )
+        elif op == 'report':
+            return self.report( request[ 'lease' ], request[ 'visited' ], request[ 'failed' ], request[ 'returned' ] )
+
+        return self.snapshot( )
+
+    def validRequest( self, request, fields ):
+        """
+        True when each field of a request has its type, ints aren't negative and lists only hold strings
+        """
+        for ( field, fieldType ) in fields.items( ):
+            value = request.get( field )
+            # bools are ints to isinstance
+            if type( value ) is not fieldType:
+                return False
+            if fieldType is int and value < 0:
+                return False
+            if fieldType is list and not all( isinstance( item, str ) for item in value ):
+                return False
+
+        return True
+
+    def lease( self, node, maxUrls ):
+        """
+        Lease a node up to maxUrls urls, each with its visit time. Returns the lease id, the urls and the
+        coordinator's clock, or no urls and the seconds to wait before asking again
+        """
+        now = time.time( )
+        self.nodes[ node ] = now
+        self.expireLeases( now )
+        self.refreshSeed( now )
+        if not self.urlRows:
+            return { 'lease': None, 'urls': [ ], 'now': now, 'retry': self.EMPTY_RETRY_SEC }
+
+        # visit times follow one global rate, +/- 25%, however many nodes share it
+        self.nextSlot = max( self.nextSlot, now )
+        urls = [ ]
+        while len( urls ) < min( maxUrls, self.MAX_LEASE_URLS ) and self.urlRows and \
+                self.nextSlot < now + self.LEASE_AHEAD_SEC:
+            urlRow = self.urlRows.pop( self.rng.randrange( len( self.urlRows ) ) )
+            urls.append( { 'url': urlRow[ 'url' ], 'at': self.nextSlot } )
+            self.nextSlot += abs( self.secPerUrl + self.rng.choice( [ -1, 1 ] ) *
+                                  self.rng.uniform( 0, self.secPerUrl / 4 ) )
+
+        if not urls:
+            retry = max( 1, self.nextSlot - self.LEASE_AHEAD_SEC - now )
+            return { 'lease': None, 'urls': [ ], 'now': now, 'retry': retry }
+
+        self.leaseId += 1
+        self.leases[ self.leaseId ] = { 'node': node, 'urls': len( urls ),
+                                        'expires': urls[ -1 ][ 'at' ] + self.LEASE_GRACE_SEC }
+        self.stats[ 'leased' ] += len( urls )
+        self.log( 'Leased %d urls to %s as lease %d' % ( len( urls ), node, self.leaseId ), level = logging.DEBUG )
+
+        return { 'lease': self.leaseId, 'urls': urls, 'now': now }
+
+    def report( self, leaseId, visited, failed, returned ):
+        """
+        Close a lease, urls a node returned unvisited go back to the window's urls for other nodes
+        """
+        lease = self.leases.pop( leaseId, None )
+        if lease is None:
+            return { 'ok': False }
+
+        self.stats[ 'visited' ] += visited
+        self.stats[ 'failed' ] += failed
+        self.stats[ 'returned' ] += len( returned )
+        self.urlRows.extend( { 'url': url } for url in returned )
+
+        return { 'ok': True }
+
+    def expireLeases( self, now ):
+        """
+        Drop leases of nodes that stopped reporting, their urls aren't handed out again
+        """
+        for ( leaseId, lease ) in list( self.leases.items( ) ):
+            if now >= lease[ 'expires' ]:
+                del self.leases[ leaseId ]
+                self.stats[ 'expired' ] += lease[ 'urls' ]
+                self.log( 'Lease %d of %s expired' % ( leaseId, lease[ 'node' ] ), level = logging.WARNING )
+
+    def refreshSeed( self, now ):
+        """
+        Load the seed urls and rate when the window is up, or early when its urls ran out
+        """
+        if self.expires is not None and now < self.expires and ( self.urlRows or not self.seedLen ):
+            return
+
+        self.expires = now + self.WINDOW_SEC
+        ( self.urlRows, ratePerHalfHour ) = self.historian.getSeedUrlData( datetime.fromtimestamp( now ) )
+        if ratePerHalfHour <= 0:
+            # nothing to browse, the window stays empty until it expires
+            self.urlRows = [ ]
+        else:
+            self.secPerUrl = round( self.WINDOW_SEC / ratePerHalfHour, 2 )
+        self.seedLen = len( self.urlRows )
+
+        self.log( 'Refreshed seed data, %d urls every %.2fs across %d nodes until %s' % (
+            len( self.urlRows ), self.secPerUrl, len( self.nodes ), datetime.fromtimestamp( self.expires ) ) )
+
+    def snapshot( self ):
+        """
+        Counts of nodes, leases and urls
+        """
+        stats = dict( self.stats )
+        stats.update( { 'nodes': len( self.nodes ), 'leases': len( self.leases ), 'secPerUrl': self.secPerUrl } )
+
+        return stats
+
+class coordclient( object ):
+    """
+    A node's connection to a coordinator, one request per connection
+    """
+    TIMEOUT_SEC = 10
+
+    def __init__( self, address, node ):
+        ( self.family, self.addr ) = parseAddress( address )
+        self.node = node
+
+    def call( self, request ):
+        """
+        Send a request and return the coordinator's response. Raises OSError or ValueError when it can't be reached
+        """
+        if self.family == socket.AF_UNIX:
+            sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+            sock.settimeout( self.TIMEOUT_SEC )
+            try:
+                sock.connect( self.addr )
+            except OSError:
+                sock.close( )
+                raise
+        else:
+            sock = socket.create_connection( self.addr, timeout = self.TIMEOUT_SEC )
+
+        with sock, sock.makefile( 'rwb' ) as stream:
+            stream.write( ( json.dumps( request ) + '\n' ).encode( ) )
+            stream.flush( )
+            response = json.loads( stream.readline( ) or b'null' )
+
+        if not isinstance( response, dict ) or 'error' in response:
+            raise ValueError( 'coordinator refused %s: %s' % ( request[ 'op' ], response ) )
+
+        return response
+
+    def lease( self, maxUrls ):
+        """
+        Lease up to maxUrls urls, visit times are converted from the coordinator's clock to this node's
+        """
+        tick = time.time( )
+        lease = self.call( { 'op': 'lease', 'node': self.node, 'max': maxUrls } )
+        offset = lease[ 'now' ] - ( tick + time.time( ) ) / 2
+        for item in lease[ 'urls' ]:
+            item[ 'at' ] -= offset
+
+        return lease
+
+    def report( self, leaseId, visited, failed, returned = [ ] ):
+        """
+        Close a lease with how its urls went, returning urls that weren't visited
+        """
+        return self.call( { 'op': 'report', 'lease': leaseId, 'visited': visited, 'failed': failed,
+                            'returned': returned } )
+
+    def stats( self ):
+        """
+        The coordinator's counts of nodes, leases and urls
+        """
+        return self.call( { 'op': 'stats' } )
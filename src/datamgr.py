@@ -1,5 +1,12 @@
-import uuid
+import os
+import time
+import shutil
 import sqlite3
+import tempfile
+import urllib.parse
+import urllib.request
+import collections
+import concurrent.futures
 from datetime import date, timedelta
 
 import logging
@@ -16,74 +23,442 @@ class datamgr( object ):
     # default name/location of the merged history database
     DEF_DB_LOC = 'history.sqlite'
 
-    # create SQL for imported/original history records
+    # number of source rows fetched and written per import transaction
+    IMPORT_BATCH_SIZE = 10000
+
+    # recent source visits whose chain root is remembered while importing, to fill in root_id
+    VISIT_CHAIN_CACHE_SIZE = 100000
+
+    # first bytes of every SQLite database file
+    SQLITE_HEADER = b'SQLite format 3\x00'
+
+    # tables that identify a browser's history database
+    BROWSER_TABLES = {
+        'firefox': [ 'moz_historyvisits', 'moz_places' ],
+        'chrome': [ 'visits', 'urls' ]
+    }
+
+    # browser databases up to this size are snapshotted in memory, larger ones into a temp file
+    SNAPSHOT_MEMORY_MAX_BYTES = 256 * 1024 * 1024
+
+    # pages copied per step of the online backup API while snapshotting
+    SNAPSHOT_BACKUP_PAGES = 4096
+
+    # seconds to wait on a browser's lock before falling back to a snapshot
+    READ_ONLY_TIMEOUT_SEC = 1.0
+
+    # connection settings applied to the history database before a bulk import
+    IMPORT_PRAGMAS = [
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA cache_size = -65536',
+        'PRAGMA temp_store = MEMORY'
+    ]
+
+    # create SQL for imported/original history records, guid is the row's integer identity,
+    # url_id, from_id (referring url) and root_id (url its click chain started at) reference urls
     SQL_CREATE_IMPORTED = '''
         DROP TABLE IF EXISTS "imported_history";
         CREATE TABLE imported_history (
             browser TEXT,
-            guid TEXT,
+            guid INTEGER PRIMARY KEY,
             seq INTEGER DEFAULT 0,
             type TEXT,
-            url LONGVARCHAR,
-            from_url LONGVARCHAR,
-            root_url LONGVARCHAR,
+            url_id INTEGER,
+            from_id INTEGER,
+            root_id INTEGER,
             visit_count INTEGER DEFAULT 0,
             timestamp DATETIME
         );
         '''
 
-    # create SQL for massaged/active history records
+    # create SQL for massaged/active history records, guid is the row's integer identity, url_id references urls
+    # day_of_week is 0-6 from Sunday (strftime %w), half_hour is the 0-47 half-hour block of the day
     SQL_CREATE_HISTORY = '''
         DROP TABLE IF EXISTS "history";
         CREATE TABLE history (
             browser TEXT,
-            guid TEXT,
+            guid INTEGER PRIMARY KEY,
             seq INTEGER DEFAULT 0,
             type TEXT,
-            url LONGVARCHAR,
-            from_url LONGVARCHAR,
-            root_url LONGVARCHAR,
+            url_id INTEGER,
             visit_count INTEGER DEFAULT 0,
-            timestamp DATETIME
+            timestamp DATETIME,
+            day_of_week INTEGER,
+            half_hour INTEGER
+        );
+        '''
+
+    # create SQL for the url dictionary, every distinct url imported is stored once
+    SQL_CREATE_URLS = '''
+        CREATE TABLE IF NOT EXISTS urls (
+            id INTEGER PRIMARY KEY,
+            url LONGVARCHAR UNIQUE,
+            host TEXT,
+            scheme TEXT
+        );
+        '''
+
+    # drop the url dictionary, only along with the tables referencing it
+    SQL_DROP_URLS = 'DROP TABLE IF EXISTS "urls"'
+
+    # columns added to tables rebuilt from imported_history after their original schema,
+    # tables missing any of them are recreated and rebuilt
+    DERIVED_TABLE_COLUMNS = {
+        'history': [ 'url_id', 'day_of_week', 'half_hour' ],
+        'seed_rollup': [ 'url_id' ],
+        'seed_rollup_totals': [ 'day_count' ],
+        'transitions': [ 'weight' ]
+    }
+
+    # columns dropped from tables rebuilt from imported_history, tables still having any of them are
+    # recreated and rebuilt. referrers are only read from imported_history, into transitions
+    DERIVED_TABLE_DROPPED_COLUMNS = {
+        'history': [ 'from_url', 'root_url' ]
+    }
+
+    SQL_SELECT_TABLE_COLUMNS = 'PRAGMA table_info( %s )'
+
+    # reclaim free pages after a migration
+    SQL_VACUUM = 'VACUUM'
+
+    # move imported history rows from uuid1 TEXT guids and url texts to integer guids and url ids, keeping their order
+    SQL_MIGRATE_IMPORTED_HISTORY = '''
+        DROP TABLE IF EXISTS "imported_history_text";
+        ALTER TABLE imported_history RENAME TO imported_history_text;
+        ''' + SQL_CREATE_IMPORTED + '''
+        INSERT INTO urls (url,host,scheme)
+        SELECT N.url, url_host( N.url ), url_scheme( N.url )
+        FROM (
+            SELECT url FROM imported_history_text
+            UNION SELECT from_url FROM imported_history_text WHERE from_url != ''
+            UNION SELECT root_url FROM imported_history_text WHERE root_url != ''
+        ) N
+        WHERE N.url NOT IN ( SELECT url FROM urls );
+        INSERT INTO imported_history (browser,seq,type,url_id,from_id,root_id,visit_count,timestamp)
+        SELECT T.browser, T.seq, T.type, U.id, F.id, R.id, T.visit_count, T.timestamp
+        FROM imported_history_text T
+        JOIN urls U ON ( U.url = T.url )
+        LEFT JOIN urls F ON ( F.url = T.from_url )
+        LEFT JOIN urls R ON ( R.url = T.root_url )
+        ORDER BY T.rowid;
+        DROP TABLE imported_history_text;
+        '''
+
+    # version of the data in the database, kept in sqlite's user_version and raised by data migrations:
+    # 1 = chrome visit times converted from the 1601 epoch
+    DATA_VERSION = 1
+    SQL_SELECT_DATA_VERSION = 'PRAGMA user_version'
+    SQL_SET_DATA_VERSION = 'PRAGMA user_version = %d'
+
+    # chrome visits imported before version 1 divided visit_time by 10^7 and ignored the 1601 epoch, which dates
+    # them no later than what that formula gives for the current time (in 2012), long before any visit a browser
+    # still keeps. they are removed along with chrome's import marks, so importing the profiles again restores them
+    SQL_DELETE_OLD_CHROME_VISITS = '''
+        DELETE FROM imported_history
+        WHERE browser = 'chrome' AND timestamp <= datetime( ( strftime( '%s', 'now' ) + 11644473600 ) / 10, 'unixepoch' )
+        '''
+    SQL_DELETE_CHROME_IMPORT_SOURCES = 'DELETE FROM import_sources WHERE browser = \'chrome\''
+
+    # names of all tables in the database
+    SQL_SELECT_TABLE_NAMES = 'SELECT name FROM sqlite_master WHERE type = \'table\''
+
+    # create SQL for per-source import high-water marks (last visit id/time seen in each browser database)
+    SQL_CREATE_IMPORT_SOURCES = '''
+        CREATE TABLE IF NOT EXISTS import_sources (
+            browser TEXT,
+            source LONGVARCHAR,
+            last_visit_id INTEGER DEFAULT 0,
+            last_visit_time INTEGER DEFAULT 0,
+            imported_at DATETIME,
+            PRIMARY KEY ( browser, source )
+        );
+        '''
+
+    # drop the import high-water marks so the next import re-reads every source
+    SQL_DROP_IMPORT_SOURCES = 'DROP TABLE IF EXISTS "import_sources"'
+
+    # create SQL for seed rollups, visit and distinct-day counts per url and per time bucket.
+    # a bucket is either a whole day of week ( day_of_week, -1 ) or a half-hour block of any day ( -1, half_hour )
+    SQL_CREATE_SEED_ROLLUP = '''
+        CREATE TABLE IF NOT EXISTS seed_rollup (
+            day_of_week INTEGER,
+            half_hour INTEGER,
+            url_id INTEGER,
+            visit_count INTEGER DEFAULT 0,
+            day_count INTEGER DEFAULT 0,
+            PRIMARY KEY ( day_of_week, half_hour, url_id )
+        );
+        CREATE INDEX IF NOT EXISTS seed_rollup_rank ON seed_rollup ( day_of_week, half_hour, visit_count, url_id, day_count );
+        CREATE TABLE IF NOT EXISTS seed_rollup_totals (
+            day_of_week INTEGER,
+            half_hour INTEGER,
+            visit_count INTEGER DEFAULT 0,
+            day_count INTEGER DEFAULT 0,
+            PRIMARY KEY ( day_of_week, half_hour )
+        );
+        '''
+
+    # drop the seed rollups, they are rebuilt from the working history table
+    SQL_DROP_SEED_ROLLUP = '''
+        DROP TABLE IF EXISTS "seed_rollup";
+        DROP TABLE IF EXISTS "seed_rollup_totals";
+        '''
+
+    # create SQL for cached seed candidates and rates per day of week / half-hour block,
+    # rows are JSON lists of seed url rows and used_at orders least-recently-used eviction
+    SQL_CREATE_SEED_CACHE = '''
+        CREATE TABLE IF NOT EXISTS seed_cache (
+            day_of_week INTEGER,
+            half_hour INTEGER,
+            daily_rows TEXT,
+            half_hour_rows TEXT,
+            daily_rate REAL,
+            half_hour_rate REAL,
+            used_at REAL,
+            PRIMARY KEY ( day_of_week, half_hour )
         );
         '''
 
+    # drop / clear cached seeds, they are recomputed from the seed rollups on demand
+    SQL_DROP_SEED_CACHE = 'DROP TABLE IF EXISTS "seed_cache"'
+    SQL_CLEAR_SEED_CACHE = 'DELETE FROM seed_cache'
+
+    # create SQL for the navigation transition index, how often a visit to from_id led to to_id.
+    # rows are clustered by from_id, so a url's next urls are one contiguous range
+    SQL_CREATE_TRANSITIONS = '''
+        CREATE TABLE IF NOT EXISTS transitions (
+            from_id INTEGER,
+            to_id INTEGER,
+            weight INTEGER DEFAULT 0,
+            PRIMARY KEY ( from_id, to_id )
+        ) WITHOUT ROWID;
+        '''
+
+    # drop / clear the transition index, it is rebuilt from imported_history
+    SQL_DROP_TRANSITIONS = 'DROP TABLE IF EXISTS "transitions"'
+    SQL_CLEAR_TRANSITIONS = 'DELETE FROM transitions'
+
+    # count transitions of imported_history rows newer than a rowid into the transition index
+    SQL_ADD_TRANSITIONS = '''
+        INSERT INTO transitions (from_id,to_id,weight)
+        SELECT I.from_id, I.url_id, count(*)
+        FROM imported_history I
+        WHERE I.rowid > ? AND I.from_id IS NOT NULL
+        GROUP BY I.from_id, I.url_id
+        ON CONFLICT ( from_id, to_id ) DO UPDATE SET weight = weight + excluded.weight
+        '''
+
+    # wildcard bucket value in seed rollups, matches every day of week / half-hour
+    SEED_ROLLUP_ANY = -1
+
+    # indexes used to group and match url-instances while rebuilding the working history table,
+    # and the natural key that lets re-imported visits be ignored
+    SQL_CREATE_INDEXES = '''
+        CREATE UNIQUE INDEX IF NOT EXISTS imported_history_visit ON imported_history ( browser, seq, url_id, timestamp );
+        CREATE INDEX IF NOT EXISTS imported_history_url_ts ON imported_history ( url_id, timestamp );
+        CREATE INDEX IF NOT EXISTS history_url_ts ON history ( url_id, timestamp );
+        CREATE INDEX IF NOT EXISTS history_timestamp ON history ( timestamp, url_id, guid );
+        CREATE INDEX IF NOT EXISTS history_day_of_week ON history ( day_of_week, url_id, timestamp, visit_count );
+        CREATE INDEX IF NOT EXISTS history_half_hour ON history ( half_hour, url_id, timestamp, visit_count );
+        '''
+
     # clear working history table
     SQL_CLEAR_URL_HISTORY = 'DELETE FROM history'
 
     # clear imported history table
     SQL_CLEAR_URL_IMPORT_HISTORY = 'DELETE FROM imported_history'
 
-    # import url data into history database for a specified table
-    SQL_INSERT_URL_HISTORY = 'INSERT INTO %s (browser,guid,seq,type,url,from_url,root_url,visit_count,timestamp) VALUES (?,?,?,?,?,?,?,?,?)'
+    # clear import high-water marks
+    SQL_CLEAR_IMPORT_SOURCES = 'DELETE FROM import_sources'
+
+    # clear the url dictionary
+    SQL_CLEAR_URLS = 'DELETE FROM urls'
+
+    # clear seed rollups
+    SQL_CLEAR_SEED_ROLLUP = 'DELETE FROM seed_rollup'
+    SQL_CLEAR_SEED_ROLLUP_TOTALS = 'DELETE FROM seed_rollup_totals'
+
+    # drop duplicate visits left by imports made before imported_history had a natural key
+    SQL_DEDUPE_IMPORTED_HISTORY = '''
+        DELETE FROM imported_history WHERE rowid NOT IN (
+            SELECT min( rowid ) FROM imported_history GROUP BY browser, seq, url_id, timestamp
+        )
+        '''
+
+    # add a url to the url dictionary unless it is already there
+    SQL_INSERT_URL = '''
+        INSERT INTO urls (url,host,scheme)
+        SELECT ?1, url_host( ?1 ), url_scheme( ?1 )
+        WHERE NOT EXISTS ( SELECT 1 FROM urls WHERE url = ?1 )
+        '''
+
+    # import url data into imported_history with its urls' ids, skipping visits that were already imported
+    SQL_INSERT_IMPORTED_HISTORY = '''
+        INSERT OR IGNORE INTO imported_history (browser,seq,type,url_id,from_id,root_id,visit_count,timestamp)
+        VALUES (?,?,?,
+            ( SELECT id FROM urls WHERE url = ? ),
+            ( SELECT id FROM urls WHERE url = ? ),
+            ( SELECT id FROM urls WHERE url = ? ),
+            ?,?)
+        '''
+
+    # merge a staged (attached) import database into urls, imported_history and import_sources,
+    # history one rowid range at a time with its staged url ids mapped to this database's
+    SQL_ATTACH_STAGED = 'ATTACH DATABASE ? AS staged'
+    SQL_DETACH_STAGED = 'DETACH DATABASE staged'
+    SQL_SELECT_STAGED_COUNT = 'SELECT coalesce( max( rowid ), 0 ) FROM staged.imported_history'
+    SQL_MERGE_STAGED_URLS = '''
+        INSERT INTO main.urls (url,host,scheme)
+        SELECT S.url, S.host, S.scheme
+        FROM staged.urls S
+        WHERE NOT EXISTS ( SELECT 1 FROM main.urls U WHERE U.url = S.url )
+        ORDER BY S.id
+        '''
+    SQL_MERGE_STAGED_HISTORY = '''
+        INSERT OR IGNORE INTO main.imported_history (browser,seq,type,url_id,from_id,root_id,visit_count,timestamp)
+        SELECT I.browser, I.seq, I.type, U.id, F.id, R.id, I.visit_count, I.timestamp
+        FROM staged.imported_history I
+        JOIN staged.urls SU ON ( SU.id = I.url_id )
+        JOIN main.urls U ON ( U.url = SU.url )
+        LEFT JOIN staged.urls SF ON ( SF.id = I.from_id )
+        LEFT JOIN main.urls F ON ( F.url = SF.url )
+        LEFT JOIN staged.urls SR ON ( SR.id = I.root_id )
+        LEFT JOIN main.urls R ON ( R.url = SR.url )
+        WHERE I.rowid > ? AND I.rowid <= ?
+        '''
+    SQL_MERGE_STAGED_SOURCES = 'INSERT OR REPLACE INTO main.import_sources SELECT * FROM staged.import_sources'
 
-    # select url data from chrome history database to be used for import
+    # high-water mark for a browser database, and its update after an import
+    SQL_SELECT_IMPORT_SOURCE = 'SELECT last_visit_id, last_visit_time FROM import_sources WHERE browser = ? AND source = ?'
+    SQL_UPDATE_IMPORT_SOURCE = '''
+        INSERT OR REPLACE INTO import_sources (browser,source,last_visit_id,last_visit_time,imported_at)
+        VALUES (?,?,?,?,datetime('now'))
+        '''
+
+    # select url data from chrome history database newer than a visit id/time to be used for import,
+    # visit_time is microseconds since 1601-01-01, 11644473600 seconds before the unix epoch
+    # columns: seq, transition, url, visit_count, timestamp, from_visit, from_url, visit_time
     SQL_SELECT_CHROME_HISTORY_FOR_IMPORT = '''
-         SELECT V.*,
-            datetime((visit_time/10000000),'unixepoch') AS timestamp,
+        SELECT V.id,
+            V.transition,
+            U.url,
             U.visit_count,
-            U.url AS url_str,
-            datetime((U.last_visit_time/10000000),'unixepoch') AS last_visit_date
+            datetime((V.visit_time/1000000) - 11644473600,'unixepoch') AS timestamp,
+            V.from_visit,
+            FU.url,
+            V.visit_time
         FROM visits AS V
         JOIN urls U ON ( U.id = V.url )
+        LEFT JOIN visits FV ON ( FV.id = V.from_visit )
+        LEFT JOIN urls FU ON ( FU.id = FV.url )
+        WHERE ( V.id > ? ) OR ( V.visit_time > ? )
+        ORDER BY V.id
         '''
 
-    # select url data from firefox history database to be used for import
+    # select url data from firefox history database newer than a visit id/time to be used for import
+    # columns: seq, visit_type, url, visit_count, timestamp, from_visit, from_url, visit_date
     SQL_SELECT_FIREFOX_HISTORY_FOR_IMPORT = '''
-        SELECT MHI.*,
-            datetime((visit_date/1000000),'unixepoch') AS timestamp,
+        SELECT MHI.id,
+            MHI.visit_type,
             MP.url,
-            MP.rev_host,
             MP.visit_count,
-            MP.frecency,
-            datetime((MP.last_visit_date/1000000),'unixepoch') AS last_visit_date,
-            MP.guid
+            datetime((MHI.visit_date/1000000),'unixepoch') AS timestamp,
+            MHI.from_visit,
+            FP.url,
+            MHI.visit_date
         FROM moz_historyvisits AS MHI
         JOIN moz_places MP ON ( MP.id = MHI.place_id )
+        LEFT JOIN moz_historyvisits FV ON ( FV.id = MHI.from_visit )
+        LEFT JOIN moz_places FP ON ( FP.id = FV.place_id )
+        WHERE ( MHI.id > ? ) OR ( MHI.visit_date > ? )
+        ORDER BY MHI.id
     '''
 
-    # select visit counts per url, returns all url-instances
-    SQL_SELECT_URL_VISIT_COUNT = 'SELECT *, count(guid) AS visit_count FROM imported_history GROUP BY url, timestamp'
+    # newest imported_history row, marks where the next import begins
+    SQL_SELECT_IMPORT_MARK = 'SELECT coalesce( max( rowid ), 0 ) FROM imported_history'
+
+    # rebuild working history from imported_history with visit counts and time buckets per url-instance,
+    # source (aliased I) filled in
+    SQL_REBUILD_URL_HISTORY = '''
+        INSERT INTO history (browser,guid,seq,type,url_id,visit_count,timestamp,day_of_week,half_hour)
+        SELECT I.browser, min(I.guid), I.seq, I.type, I.url_id, count(I.guid), I.timestamp,
+            CAST( strftime( '%%w', I.timestamp ) AS INTEGER ),
+            2 * CAST( strftime( '%%H', I.timestamp ) AS INTEGER ) + CAST( strftime( '%%M', I.timestamp ) AS INTEGER ) / 30
+        FROM %s
+        GROUP BY I.url_id, I.timestamp
+        '''
+
+    # full and affected-only sources for SQL_REBUILD_URL_HISTORY
+    SQL_REBUILD_SOURCE_ALL = 'imported_history I'
+    SQL_REBUILD_SOURCE_AFFECTED = '''affected_history A
+        JOIN imported_history I ON ( I.url_id = A.url_id AND I.timestamp = A.timestamp )'''
+
+    # stage the url-instances touched by imported_history rows newer than a mark
+    SQL_DROP_AFFECTED_HISTORY = 'DROP TABLE IF EXISTS temp.affected_history'
+    SQL_CREATE_AFFECTED_HISTORY = '''
+        CREATE TEMP TABLE affected_history AS
+        SELECT DISTINCT url_id, timestamp FROM imported_history WHERE rowid > ?
+        '''
+
+    # remove working history rows for the staged url-instances
+    SQL_CLEAR_AFFECTED_HISTORY = '''
+        DELETE FROM history WHERE rowid IN (
+            SELECT H.rowid
+            FROM affected_history A
+            JOIN history H ON ( H.url_id = A.url_id AND H.timestamp = A.timestamp )
+        )
+        '''
+
+    # stage the day-of-week / half-hour buckets and urls of the staged url-instances
+    SQL_DROP_AFFECTED_BUCKETS = 'DROP TABLE IF EXISTS temp.affected_buckets'
+    SQL_CREATE_AFFECTED_BUCKETS = '''
+        CREATE TEMP TABLE affected_buckets AS
+        SELECT DISTINCT H.day_of_week, H.half_hour, H.url_id
+        FROM affected_history A
+        JOIN history H ON ( H.url_id = A.url_id AND H.timestamp = A.timestamp )
+        '''
+
+    # (re)calculate seed rollups per url for each day of week / half-hour block, source (aliased H) filled in
+    SQL_ROLLUP_DAY_OF_WEEK = '''
+        INSERT OR REPLACE INTO seed_rollup (day_of_week,half_hour,url_id,visit_count,day_count)
+        SELECT H.day_of_week, -1, H.url_id, sum( H.visit_count ), count( DISTINCT date( H.timestamp ) )
+        FROM %s
+        GROUP BY H.day_of_week, H.url_id
+        '''
+    SQL_ROLLUP_HALF_HOUR = '''
+        INSERT OR REPLACE INTO seed_rollup (day_of_week,half_hour,url_id,visit_count,day_count)
+        SELECT -1, H.half_hour, H.url_id, sum( H.visit_count ), count( DISTINCT date( H.timestamp ) )
+        FROM %s
+        GROUP BY H.half_hour, H.url_id
+        '''
+
+    # full and affected-only sources for SQL_ROLLUP_DAY_OF_WEEK / SQL_ROLLUP_HALF_HOUR
+    SQL_ROLLUP_SOURCE_ALL = 'history H'
+    SQL_ROLLUP_SOURCE_AFFECTED_DAY_OF_WEEK = '''( SELECT DISTINCT day_of_week, url_id FROM affected_buckets ) B
+        JOIN history H ON ( H.url_id = B.url_id AND H.day_of_week = B.day_of_week )'''
+    SQL_ROLLUP_SOURCE_AFFECTED_HALF_HOUR = '''( SELECT DISTINCT half_hour, url_id FROM affected_buckets ) B
+        JOIN history H ON ( H.url_id = B.url_id AND H.half_hour = B.half_hour )'''
+
+    # (re)calculate seed rollup totals for each day of week / half-hour block, optional filter filled in
+    SQL_ROLLUP_DAY_OF_WEEK_TOTALS = '''
+        INSERT OR REPLACE INTO seed_rollup_totals (day_of_week,half_hour,visit_count,day_count)
+        SELECT H.day_of_week, -1, sum( H.visit_count ), count( DISTINCT date( H.timestamp ) )
+        FROM history H
+        %s
+        GROUP BY H.day_of_week
+        '''
+    SQL_ROLLUP_HALF_HOUR_TOTALS = '''
+        INSERT OR REPLACE INTO seed_rollup_totals (day_of_week,half_hour,visit_count,day_count)
+        SELECT -1, H.half_hour, sum( H.visit_count ), count( DISTINCT date( H.timestamp ) )
+        FROM history H
+        %s
+        GROUP BY H.half_hour
+        '''
+
+    # affected-only filters for SQL_ROLLUP_DAY_OF_WEEK_TOTALS / SQL_ROLLUP_HALF_HOUR_TOTALS
+    SQL_ROLLUP_FILTER_AFFECTED_DAY_OF_WEEK = 'WHERE H.day_of_week IN ( SELECT day_of_week FROM affected_buckets )'
+    SQL_ROLLUP_FILTER_AFFECTED_HALF_HOUR = 'WHERE H.half_hour IN ( SELECT half_hour FROM affected_buckets )'
 
     def __init__(self,db):
         self._db = db
@@ -101,6 +476,12 @@ class datamgr( object ):
     def conn( self ):
         return self._dbConn
 
+    def isOpen( self ):
+        """
+        True once a database has been opened
+        """
+        return isinstance( self._dbConn, sqlite3.Connection )
+
     def curs( self ):
         return self._dbCurs
 
@@ -117,6 +498,8 @@ class datamgr( object ):
         """
         self._dbConn = sqlite3.connect( location, detect_types = sqlite3.PARSE_COLNAMES )
         self.conn( ).row_factory = sqlite3.Row
+        self.conn( ).create_function( 'url_host', 1, self.urlHost, deterministic = True )
+        self.conn( ).create_function( 'url_scheme', 1, self.urlScheme, deterministic = True )
         self._dbCurs = self.conn( ).cursor( )
 
     def clearDb( self, location = DEF_DB_LOC ):
@@ -127,6 +510,17 @@ class datamgr( object ):
         self.log( 'Clearing database' )
         self.executeSql( self.SQL_CLEAR_URL_HISTORY )
         self.executeSql( self.SQL_CLEAR_URL_IMPORT_HISTORY )
+        self.executeSqlScript( self.SQL_CREATE_IMPORT_SOURCES )
+        self.executeSql( self.SQL_CLEAR_IMPORT_SOURCES )
+        self.executeSqlScript( self.SQL_CREATE_URLS )
+        self.executeSql( self.SQL_CLEAR_URLS )
+        self.executeSqlScript( self.SQL_CREATE_SEED_ROLLUP )
+        self.executeSql( self.SQL_CLEAR_SEED_ROLLUP )
+        self.executeSql( self.SQL_CLEAR_SEED_ROLLUP_TOTALS )
+        self.executeSqlScript( self.SQL_CREATE_SEED_CACHE )
+        self.executeSql( self.SQL_CLEAR_SEED_CACHE )
+        self.executeSqlScript( self.SQL_CREATE_TRANSITIONS )
+        self.executeSql( self.SQL_CLEAR_TRANSITIONS )
         self.conn( ).commit( )
 
     def initDb( self, location = DEF_DB_LOC ):
@@ -142,9 +536,105 @@ class datamgr( object ):
         """
         self.executeSqlScript( self.SQL_CREATE_IMPORTED )
         self.executeSqlScript( self.SQL_CREATE_HISTORY )
+        self.executeSql( self.SQL_DROP_IMPORT_SOURCES )
+        self.executeSql( self.SQL_DROP_URLS )
+        self.executeSqlScript( self.SQL_DROP_SEED_ROLLUP )
+        self.executeSql( self.SQL_DROP_SEED_CACHE )
+        self.executeSql( self.SQL_DROP_TRANSITIONS )
+        self.ensureDbTables( )
         self.log( 'Executed creation commands' )
         self.conn( ).commit( )
 
+    def ensureDbTables( self ):
+        """
+        Create tables/columns/indexes missing from databases made by older versions,
+        returns True if the working history table needs a full rebuild afterwards
+        """
+        if not self.getTableColumns( 'history' ):
+            self.log( 'No history tables found, creating them' )
+            self.createDbTables( )
+            return False
+
+        rebuild = False
+        self.executeSqlScript( self.SQL_CREATE_IMPORT_SOURCES )
+        self.executeSqlScript( self.SQL_CREATE_URLS )
+        columns = self.getTableColumns( 'imported_history' )
+        if not columns[ 'guid' ][ 'pk' ] or 'url' in columns:
+            self.migrateImportedHistory( )
+            rebuild = True
+
+        for ( table, required ) in sorted( self.DERIVED_TABLE_COLUMNS.items( ) ):
+            columns = self.getTableColumns( table )
+            dropped = self.DERIVED_TABLE_DROPPED_COLUMNS.get( table, [ ] )
+            if not all( column in columns for column in required ) or any( column in columns for column in dropped ):
+                self.log( 'Recreating outdated or missing table `%s`' % table )
+                rebuild = True
+
+        if rebuild:
+            self.executeSqlScript( self.SQL_CREATE_HISTORY )
+            self.executeSqlScript( self.SQL_DROP_SEED_ROLLUP )
+            self.executeSql( self.SQL_DROP_SEED_CACHE )
+
+        self.executeSqlScript( self.SQL_CREATE_SEED_ROLLUP )
+        self.executeSqlScript( self.SQL_CREATE_SEED_CACHE )
+        self.executeSqlScript( self.SQL_CREATE_TRANSITIONS )
+
+        try:
+            self.executeSqlScript( self.SQL_CREATE_INDEXES )
+        except sqlite3.IntegrityError:
+            self.log( 'Removing duplicate visits from imported history' )
+            self.executeSql( self.SQL_DEDUPE_IMPORTED_HISTORY )
+            self.conn( ).commit( )
+            self.executeSqlScript( self.SQL_CREATE_INDEXES )
+            rebuild = True
+
+        self.executeSql( self.SQL_SELECT_DATA_VERSION )
+        if self.curs( ).fetchone( )[ 0 ] < 1:
+            rebuild = self.migrateChromeTimestamps( ) or rebuild
+        self.executeSql( self.SQL_SET_DATA_VERSION % self.DATA_VERSION )
+
+        self.conn( ).commit( )
+
+        return rebuild
+
+    def getTableColumns( self, table ):
+        """
+        Returns { column name: PRAGMA table_info row } for a table, empty if the table doesn't exist
+        """
+        self.executeSql( self.SQL_SELECT_TABLE_COLUMNS % table )
+
+        return { column[ 'name' ]: column for column in self.curs( ).fetchall( ) }
+
+    def migrateImportedHistory( self ):
+        """
+        Replace uuid1 TEXT guids and url texts from older versions with integer row identities and url ids,
+        the working history table and seed rollups are recreated empty and must be rebuilt
+        """
+        tick = time.time( )
+        self.log( 'Migrating imported history to integer row ids and url ids' )
+        self.executeSqlScript( self.SQL_MIGRATE_IMPORTED_HISTORY )
+        self.executeSqlScript( self.SQL_CREATE_HISTORY )
+        self.executeSqlScript( self.SQL_DROP_SEED_ROLLUP )
+        self.conn( ).commit( )
+        self.executeSql( self.SQL_VACUUM )
+        self.log( 'Migrated imported history in %.2fs' % ( time.time( ) - tick ) )
+
+    def migrateChromeTimestamps( self ):
+        """
+        Remove chrome visits imported with the wrong epoch and reset chrome's import marks, so the next import
+        of each chrome profile reads them again with their real times. Returns True if any were removed
+        """
+        self.executeSql( self.SQL_DELETE_OLD_CHROME_VISITS )
+        removed = self.curs( ).rowcount
+        if not removed:
+            return False
+
+        self.executeSql( self.SQL_DELETE_CHROME_IMPORT_SOURCES )
+        self.log( 'Removed %d chrome visits imported with wrong timestamps, import your chrome profiles again' % removed,
+                  level = logging.WARNING )
+
+        return True
+
     def lcdVisitType( self, browser, typeFromDb ):
         """
         Match a visit type int for a browser to a generic/shared visit type
@@ -158,110 +648,426 @@ class datamgr( object ):
         else:
             return chrome[ max( 0, typeFromDb ) ]
 
+    def urlHost( self, url ):
+        """
+        Returns the lowercase host of a url, '' if it has none
+        """
+        try:
+            return urllib.parse.urlsplit( url or '' ).hostname or ''
+        except ValueError:
+            return ''
+
+    def urlScheme( self, url ):
+        """
+        Returns the lowercase scheme of a url, '' if it has none
+        """
+        try:
+            return urllib.parse.urlsplit( url or '' ).scheme
+        except ValueError:
+            return ''
+
     # Import / Insert Functions
-    def importDatabase( self, browser, filename ):
+    def importDatabase( self, browser, filename, affectedOnly = False, rebuild = True ):
+        """
+        Import a browser database into the generic history database,
+        optionally only rebuilding working history rows touched by this import
+        """
+        self.importDatabases( [ ( browser, filename ) ], affectedOnly, rebuild = rebuild )
+
+    def importDatabases( self, sources, affectedOnly = False, workers = 1, rebuild = True ):
+        """
+        Import browser databases [ ( browser, filename ), ... ] into the generic history database,
+        reading them with up to `workers` processes, then rebuild the working history table once.
+        Without rebuild, the caller rebuilds it with rebuildUrlHistoryTable
+        """
+        self.applyImportPragmas( )
+        if self.ensureDbTables( ):
+            affectedOnly = False
+
+        self.executeSql( self.SQL_SELECT_IMPORT_MARK )
+        importMark = self.curs( ).fetchone( )[ 0 ]
+        if ( workers > 1 ) and ( len( sources ) > 1 ):
+            imported = self.importStagedDatabases( sources, workers )
+        else:
+            imported = 0
+            for ( browser, filename ) in sources:
+                imported += self.importBrowserDatabase( browser, filename )
+
+        if not rebuild:
+            self.conn( ).commit( )
+            return
+
+        if affectedOnly and not imported:
+            self.log( 'No new visits, working history table is up to date' )
+            return
+
+        self.log( 'Rebuilding the working history table' )
+        self.rebuildUrlHistoryTable( importMark if affectedOnly else None )
+        self.conn( ).commit( )
+
+    def importBrowserDatabase( self, browser, filename ):
         """
-        Import a browser database into the generic history database
+        Import a single browser database into imported_history, returns the number of new visits
         """
         self.log( '[%s] Loading Database' % browser.title( ) )
         if browser == 'firefox':
-            self.importFirefoxDatabase( filename )
+            return self.importFirefoxDatabase( filename )
         else:
-            self.importChromeDatabase( filename )
+            return self.importChromeDatabase( filename )
 
-        self.log( 'Rebuilding the working history table' )
-        self.rebuildUrlHistoryTable( )
+    def importStagedDatabases( self, sources, workers ):
+        """
+        Read browser databases in a process pool, each into its own staging database,
+        and merge every staging database into imported_history as it finishes
+        """
+        imported = 0
+        stagingDir = tempfile.mkdtemp( prefix = 'dirtyboots-' )
+        self.log( 'Importing %d databases with %d workers' % ( len( sources ), workers ) )
+        try:
+            with concurrent.futures.ProcessPoolExecutor( max_workers = workers ) as pool:
+                futures = [ ]
+                for ( idx, ( browser, filename ) ) in enumerate( sources ):
+                    mark = self.getImportSourceMark( browser, os.path.abspath( filename ) )
+                    stagingPath = os.path.join( stagingDir, '%d.sqlite' % idx )
+                    futures.append( pool.submit( stageBrowserDatabase, browser, filename, mark, stagingPath ) )
+
+                for future in concurrent.futures.as_completed( futures ):
+                    imported += self.mergeStagedDatabase( future.result( ) )
+        finally:
+            shutil.rmtree( stagingDir, ignore_errors = True )
+
+        return imported
+
+    def mergeStagedDatabase( self, stagingPath ):
+        """
+        Merge a staging database's visits and high-water mark into this database,
+        one transaction per batch. Returns the number of new visits
+        """
+        imported = 0
+        self.conn( ).commit( )
+        self.executeSql( self.SQL_ATTACH_STAGED, ( stagingPath, ) )
+        self.executeSql( self.SQL_SELECT_STAGED_COUNT )
+        lastRowId = self.curs( ).fetchone( )[ 0 ]
+        self.executeSql( self.SQL_MERGE_STAGED_URLS )
+        for firstRowId in range( 0, lastRowId, self.IMPORT_BATCH_SIZE ):
+            self.executeSql( self.SQL_MERGE_STAGED_HISTORY, ( firstRowId, firstRowId + self.IMPORT_BATCH_SIZE ) )
+            imported += max( self.curs( ).rowcount, 0 )
+            self.conn( ).commit( )
+
+        self.executeSql( self.SQL_MERGE_STAGED_SOURCES )
+        self.conn( ).commit( )
+        self.executeSql( self.SQL_DETACH_STAGED )
+        self.log( 'Merged %d new visits from %s' % ( imported, stagingPath ) )
+
+        return imported
+
+    def detectBrowser( self, filename ):
+        """
+        Returns which browser a history database file belongs to, or None if it isn't one
+        """
+        try:
+            with open( filename, 'rb' ) as f:
+                if f.read( len( self.SQLITE_HEADER ) ) != self.SQLITE_HEADER:
+                    return None
+
+            conn = self.connectReadOnly( filename, immutable = True )
+            tables = [ row[ 0 ] for row in conn.execute( self.SQL_SELECT_TABLE_NAMES ) ]
+            conn.close( )
+        except ( OSError, sqlite3.Error ) as e:
+            self.log( 'Unable to inspect %s: %s' % ( filename, e ), level = logging.WARNING )
+            return None
+
+        for browser, browserTables in sorted( self.BROWSER_TABLES.items( ) ):
+            if all( table in tables for table in browserTables ):
+                return browser
+
+        return None
+
+    def findBrowserDatabases( self, paths, browser = 'auto' ):
+        """
+        Expand files/directories into [ ( browser, filename ), ... ] for every browser history database,
+        detecting the browser per file unless one is given
+        """
+        sources = [ ]
+        for path in paths:
+            filenames = [ path ]
+            if os.path.isdir( path ):
+                filenames = [ ]
+                for ( dirPath, dirNames, fileNames ) in os.walk( path ):
+                    dirNames.sort( )
+                    filenames.extend( os.path.join( dirPath, fileName ) for fileName in sorted( fileNames ) )
+
+            for filename in filenames:
+                fileBrowser = self.detectBrowser( filename ) if browser == 'auto' else browser
+                if fileBrowser:
+                    self.log( 'Found %s history database %s' % ( fileBrowser, filename ) )
+                    sources.append( ( fileBrowser, filename ) )
+                elif filename == path:
+                    self.log( 'Skipping %s, not a browser history database' % filename, level = logging.WARNING )
+
+        return sources
+
+    def applyImportPragmas( self ):
+        """
+        Tune the history database connection for bulk writes
+        """
         self.conn( ).commit( )
+        for pragma in self.IMPORT_PRAGMAS:
+            self.executeSql( pragma )
 
     def importChromeDatabase( self, filename ):
         """
         Imports a Chrome database into the generic history database
         """
         self.log( '[ChromeDB] Loading database from %s' % filename )
-        conn = sqlite3.connect( filename )
-        conn.row_factory = sqlite3.Row
-        curs = conn.cursor( )
-        self.executeSql( self.SQL_SELECT_CHROME_HISTORY_FOR_IMPORT, curs = curs )
-        urlsToImport = curs.fetchall( )
-        self.log( '[ChromeDB] Importing %d urls into database' % len( urlsToImport ) )
-        for urlRecord in urlsToImport:
-            transCode = 0xFF & urlRecord[ 'transition' ]
-            visitType = self.lcdVisitType( 'chrome', transCode )
-            formattedRow = {
-                'browser': 'chrome',
-                'guid': str( uuid.uuid1( ) ),
-                'seq': urlRecord[ 'id' ],
-                'type': visitType,
-                'url': urlRecord[ 'url_str' ],
-                'visit_count': urlRecord[ 'visit_count' ],
-                'from_url': '',
-                'root_url': '',
-                'timestamp': urlRecord[ 'timestamp' ]
-            }
-            self.insertFormattedHistoryRow( formattedRow )
+        return self.importSourceDatabase( 'chrome', filename, self.SQL_SELECT_CHROME_HISTORY_FOR_IMPORT,
+                                          self.formatChromeRow )
 
     def importFirefoxDatabase( self, filename ):
         """
         Imports a Firefox database into the generic history database
         """
         self.log( '[FirefoxDB] Loading database from %s' % filename )
-        conn = sqlite3.connect( filename )
-        conn.row_factory = sqlite3.Row
-        curs = conn.cursor( )
-        self.executeSql( self.SQL_SELECT_FIREFOX_HISTORY_FOR_IMPORT, curs = curs )
-        urlsToImport = curs.fetchall( )
-        self.log( '[FirefoxDB] Importing %d urls into database' % len( urlsToImport ) )
-        for urlRecord in urlsToImport:
-            visitType = self.lcdVisitType( 'firefox', urlRecord[ 'visit_type' ] )
-            formattedRow = {
-                'browser': 'firefox',
-                'guid': str( uuid.uuid1( ) ),
-                'seq': urlRecord[ 'id' ],
-                'type': visitType,
-                'url': urlRecord[ 'url' ],
-                'visit_count': urlRecord[ 'visit_count' ],
-                'from_url': '',
-                'root_url': '',
-                'timestamp': urlRecord[ 'timestamp' ]
-            }
-            self.insertFormattedHistoryRow( formattedRow )
-
-    def insertFormattedHistoryRowHelper( self, table, formattedRow ):
-        """
-        Inserts a row for the history database into one of the *history tables
-        """
-        self.executeSql( self.SQL_INSERT_URL_HISTORY % table, [
-            formattedRow[ 'browser' ],
-            formattedRow[ 'guid' ],
-            formattedRow[ 'seq' ],
-            formattedRow[ 'type' ],
-            formattedRow[ 'url' ],
-            formattedRow[ 'from_url' ],
-            formattedRow[ 'root_url' ],
-            formattedRow[ 'visit_count' ],
-            formattedRow[ 'timestamp' ]
-        ] )
-
-    def insertFormattedHistoryRow( self, formattedRow ):
-        """
-        Inserts formatted url-rows into imported_history
-        """
-        self.insertFormattedHistoryRowHelper( 'imported_history', formattedRow )
-
-    def rebuildUrlHistoryTable( self ):
-        """
-        Inserts formatted url-rows into history after updating their count
-        """
-        self.log( 'Recalculating visit counts and records for all browsers' )
-        self.executeSql( self.SQL_CLEAR_URL_HISTORY )
-        self.executeSql( self.SQL_SELECT_URL_VISIT_COUNT )
-        urlsToUpdate = self.curs( ).fetchall( )
+        return self.importSourceDatabase( 'firefox', filename, self.SQL_SELECT_FIREFOX_HISTORY_FOR_IMPORT,
+                                          self.formatFirefoxRow )
+
+    def importSourceDatabase( self, browser, filename, sql, formatRow ):
+        """
+        Imports visits newer than the source's high-water mark, then advances the mark.
+        Returns the number of visits that were new to imported_history
+        """
+        source = os.path.abspath( filename )
+        ( lastVisitId, lastVisitTime ) = self.getImportSourceMark( browser, source )
+        self.log( '[%s] Importing visits after id %d / time %d' % ( browser.title( ), lastVisitId, lastVisitTime ) )
+
+        ( conn, snapshotPath ) = self.openBrowserDatabase( filename )
+        try:
+            try:
+                curs = conn.cursor( )
+                self.executeSql( sql, ( lastVisitId, lastVisitTime ), curs = curs )
+                result = self.importRows( browser, curs, formatRow, lastVisitId, lastVisitTime )
+            except sqlite3.OperationalError as e:
+                # the browser locked its database mid-import, already imported visits are ignored on retry
+                if snapshotPath:
+                    raise
+                self.log( '[%s] Lost read access to %s (%s)' % ( browser.title( ), filename, e ), level = logging.WARNING )
+                conn.close( )
+                ( conn, snapshotPath ) = self.snapshotBrowserDatabase( filename )
+                curs = conn.cursor( )
+                self.executeSql( sql, ( lastVisitId, lastVisitTime ), curs = curs )
+                result = self.importRows( browser, curs, formatRow, lastVisitId, lastVisitTime )
+        finally:
+            conn.close( )
+            self.removeSnapshot( snapshotPath )
+
+        ( imported, lastVisitId, lastVisitTime ) = result
+        self.executeSql( self.SQL_UPDATE_IMPORT_SOURCE, ( browser, source, lastVisitId, lastVisitTime ) )
+        self.conn( ).commit( )
+
+        return imported
+
+    def connectReadOnly( self, filename, immutable = False ):
+        """
+        Connect to a database file through a read-only URI, immutable connections also ignore locks
+        """
+        uri = 'file:%s?mode=ro' % urllib.request.pathname2url( os.path.abspath( filename ) )
+        if immutable:
+            uri += '&immutable=1'
+
+        return sqlite3.connect( uri, uri = True, timeout = self.READ_ONLY_TIMEOUT_SEC )
+
+    def openBrowserDatabase( self, filename ):
+        """
+        Open a (possibly live) browser database without contending with the browser: read-only if it
+        can be read, otherwise a snapshot. Returns ( connection, snapshot path or None )
+        """
+        conn = None
+        try:
+            conn = self.connectReadOnly( filename )
+            conn.execute( self.SQL_SELECT_TABLE_NAMES ).fetchall( )
+            return ( conn, None )
+        except sqlite3.OperationalError as e:
+            self.log( 'Unable to read %s (%s), taking a snapshot' % ( filename, e ), level = logging.WARNING )
+            if conn:
+                conn.close( )
+
+        return self.snapshotBrowserDatabase( filename )
 
-        self.log( 'Importing results into emptied `history` table' )
-        for urlToUpdate in urlsToUpdate:
-            self.insertFormattedHistoryRowHelper( 'history', urlToUpdate )
+    def snapshotBrowserDatabase( self, filename ):
+        """
+        Copy a browser database with the online backup API, ignoring the browser's locks, into memory
+        or a temp file depending on its size. Returns ( connection, snapshot path )
+        """
+        snapshotPath = ':memory:'
+        if os.path.getsize( filename ) > self.SNAPSHOT_MEMORY_MAX_BYTES:
+            ( fd, snapshotPath ) = tempfile.mkstemp( prefix = 'dirtyboots-', suffix = '.sqlite' )
+            os.close( fd )
+
+        tick = time.time( )
+        source = self.connectReadOnly( filename, immutable = True )
+        conn = sqlite3.connect( snapshotPath )
+        try:
+            source.backup( conn, pages = self.SNAPSHOT_BACKUP_PAGES )
+        except sqlite3.Error:
+            conn.close( )
+            self.removeSnapshot( snapshotPath )
+            raise
+        finally:
+            source.close( )
+
+        self.log( 'Snapshotted %s into %s in %.2fs' % ( filename, snapshotPath, time.time( ) - tick ) )
+
+        return ( conn, snapshotPath )
+
+    def removeSnapshot( self, snapshotPath ):
+        """
+        Delete a temp file snapshot, in-memory snapshots go away with their connection
+        """
+        if snapshotPath and ( snapshotPath != ':memory:' ) and os.path.exists( snapshotPath ):
+            os.remove( snapshotPath )
+
+    def getImportSourceMark( self, browser, source ):
+        """
+        Returns the last ( visit id, visit time ) imported from a browser database, ( 0, 0 ) if never imported
+        """
+        self.executeSql( self.SQL_SELECT_IMPORT_SOURCE, ( browser, source ) )
+        mark = self.curs( ).fetchone( )
+
+        return ( mark[ 0 ], mark[ 1 ] ) if mark else ( 0, 0 )
+
+    def formatChromeRow( self, urlRecord ):
+        """
+        Convert a Chrome import row into an imported_history insert tuple
+        """
+        ( seq, transition, url, visitCount, timestamp, fromVisit, fromUrl, visitTime ) = urlRecord
+        visitType = self.lcdVisitType( 'chrome', 0xFF & transition )
+        return ( 'chrome', seq, visitType, url, fromUrl, None, visitCount, timestamp )
+
+    def formatFirefoxRow( self, urlRecord ):
+        """
+        Convert a Firefox import row into an imported_history insert tuple
+        """
+        ( seq, transition, url, visitCount, timestamp, fromVisit, fromUrl, visitTime ) = urlRecord
+        visitType = self.lcdVisitType( 'firefox', transition )
+        return ( 'firefox', seq, visitType, url, fromUrl, None, visitCount, timestamp )
+
+    def linkVisitChains( self, urlRecords, rows, roots ):
+        """
+        Fill in the root url of formatted rows by following their source visits' from_visit chains.
+        roots maps recent visit ids to the url their chain started at, visits whose parent isn't
+        remembered use the parent's url as their root
+        """
+        linked = [ ]
+        for ( urlRecord, row ) in zip( urlRecords, rows ):
+            ( seq, fromVisit, url, fromUrl ) = ( urlRecord[ 0 ], urlRecord[ 5 ], row[ 3 ], row[ 4 ] )
+            rootUrl = roots.get( fromVisit, fromUrl ) if fromUrl else None
+            roots[ seq ] = rootUrl or url
+            linked.append( row[ :5 ] + ( rootUrl, ) + row[ 6: ] )
+
+        while len( roots ) > self.VISIT_CHAIN_CACHE_SIZE:
+            roots.popitem( last = False )
+
+        return linked
+
+    def insertUrls( self, urls ):
+        """
+        Add urls missing from the url dictionary in first-seen order, None is skipped. Does not commit
+        """
+        urls = collections.OrderedDict.fromkeys( url for url in urls if url is not None )
+        self.executeManySql( self.SQL_INSERT_URL, [ ( url, ) for url in urls ] )
+
+    def importRows( self, browser, curs, formatRow, lastVisitId = 0, lastVisitTime = 0 ):
+        """
+        Stream rows from a source cursor (ordered by visit id, visit time last) into imported_history,
+        one transaction per batch. Returns ( new visits, last visit id, last visit time )
+        """
+        total = 0
+        imported = 0
+        tick = time.time( )
+        roots = collections.OrderedDict( )
+        urlRecords = curs.fetchmany( self.IMPORT_BATCH_SIZE )
+        while urlRecords:
+            rows = self.linkVisitChains( urlRecords, [ formatRow( urlRecord ) for urlRecord in urlRecords ], roots )
+            self.insertUrls( url for row in rows for url in row[ 3:6 ] )
+            self.executeManySql( self.SQL_INSERT_IMPORTED_HISTORY, rows )
+            imported += max( self.curs( ).rowcount, 0 )
+            self.conn( ).commit( )
+            total += len( urlRecords )
+            lastVisitId = max( lastVisitId, urlRecords[ -1 ][ 0 ] )
+            lastVisitTime = max( lastVisitTime, max( urlRecord[ -1 ] for urlRecord in urlRecords ) )
+            self.log( '[%s] Imported %d urls' % ( browser.title( ), total ), level = logging.DEBUG )
+            urlRecords = curs.fetchmany( self.IMPORT_BATCH_SIZE )
+
+        elapsed = max( time.time( ) - tick, 0.001 )
+        self.log( '[%s] Imported %d urls in %.2fs [ %.0f rows/sec ], %d already imported' % (
+            browser.title( ), total, elapsed, total / elapsed, total - imported ) )
+
+        return ( imported, lastVisitId, lastVisitTime )
+
+    def rebuildUrlHistoryTable( self, sinceRowId = None ):
+        """
+        Rebuilds history and its seed rollups from imported_history with updated visit counts,
+        in a single transaction. With sinceRowId, only url-instances with imported rows newer
+        than that rowid (and the rollups they belong to) are rebuilt
+        """
+        self.conn( ).commit( )
+        tick = time.time( )
+        if sinceRowId is None:
+            self.log( 'Recalculating visit counts and records for all browsers' )
+            self.executeSql( self.SQL_CLEAR_URL_HISTORY )
+            self.executeSql( self.SQL_REBUILD_URL_HISTORY % self.SQL_REBUILD_SOURCE_ALL )
+        else:
+            self.log( 'Recalculating visit counts and records imported after row %d' % sinceRowId )
+            self.executeSql( self.SQL_DROP_AFFECTED_HISTORY )
+            self.executeSql( self.SQL_CREATE_AFFECTED_HISTORY, ( sinceRowId, ) )
+            self.executeSql( self.SQL_CLEAR_AFFECTED_HISTORY )
+            self.executeSql( self.SQL_REBUILD_URL_HISTORY % self.SQL_REBUILD_SOURCE_AFFECTED )
+
+        rowCount = self.curs( ).rowcount
+        self.rebuildTransitions( sinceRowId )
+        self.rebuildSeedRollup( sinceRowId is not None )
+
+        # cached seeds were computed from the old rollups
+        self.executeSql( self.SQL_CLEAR_SEED_CACHE )
+        self.conn( ).commit( )
+        self.executeSql( self.SQL_DROP_AFFECTED_HISTORY )
+        self.log( 'Finished rebuilding %d rows of the working `history` table in %.2fs' % (
+            rowCount, time.time( ) - tick ) )
+
+    def rebuildTransitions( self, sinceRowId = None ):
+        """
+        Recounts the transition index from imported_history, or adds the transitions of rows
+        newer than sinceRowId. Does not commit
+        """
+        if sinceRowId is None:
+            self.log( 'Recounting navigation transitions' )
+            self.executeSql( self.SQL_CLEAR_TRANSITIONS )
 
-        self.log( 'Finished import into working `history` table' )
+        self.executeSql( self.SQL_ADD_TRANSITIONS, ( sinceRowId or 0, ) )
+
+    def rebuildSeedRollup( self, affectedOnly = False ):
+        """
+        Recalculates seed rollups from history, either fully or only for the buckets
+        of url-instances staged in affected_history. Does not commit
+        """
+        if not affectedOnly:
+            self.log( 'Recalculating seed rollups for all buckets' )
+            self.executeSql( self.SQL_CLEAR_SEED_ROLLUP )
+            self.executeSql( self.SQL_CLEAR_SEED_ROLLUP_TOTALS )
+            self.executeSql( self.SQL_ROLLUP_DAY_OF_WEEK % self.SQL_ROLLUP_SOURCE_ALL )
+            self.executeSql( self.SQL_ROLLUP_HALF_HOUR % self.SQL_ROLLUP_SOURCE_ALL )
+            self.executeSql( self.SQL_ROLLUP_DAY_OF_WEEK_TOTALS % '' )
+            self.executeSql( self.SQL_ROLLUP_HALF_HOUR_TOTALS % '' )
+            return
+
+        self.log( 'Recalculating seed rollups for imported buckets' )
+        self.executeSql( self.SQL_DROP_AFFECTED_BUCKETS )
+        self.executeSql( self.SQL_CREATE_AFFECTED_BUCKETS )
+        self.executeSql( self.SQL_ROLLUP_DAY_OF_WEEK % self.SQL_ROLLUP_SOURCE_AFFECTED_DAY_OF_WEEK )
+        self.executeSql( self.SQL_ROLLUP_HALF_HOUR % self.SQL_ROLLUP_SOURCE_AFFECTED_HALF_HOUR )
+        self.executeSql( self.SQL_ROLLUP_DAY_OF_WEEK_TOTALS % self.SQL_ROLLUP_FILTER_AFFECTED_DAY_OF_WEEK )
+        self.executeSql( self.SQL_ROLLUP_HALF_HOUR_TOTALS % self.SQL_ROLLUP_FILTER_AFFECTED_HALF_HOUR )
+        self.executeSql( self.SQL_DROP_AFFECTED_BUCKETS )
 
     # SQL Execution Functions
     def _execute( self, sql, args = None, curs = None, single = True ):
@@ -287,8 +1093,36 @@ class datamgr( object ):
         """
         self._execute( sql, args, curs )
 
+    def executeManySql( self, sql, rows, curs = None ):
+        """
+        Execute SQL command once per args-row, only the statement is logged in debug log
+        """
+        if not curs:
+            curs = self.curs( )
+
+        self.log( 'SQL: %s | args: [executemany]' % sql, level = logging.DEBUG )
+        curs.executemany( sql, rows )
+
     def executeSqlScript( self, sql, curs = None ):
         """
         Execute SQL command (w/ optional args) and log in debug log
         """
-        self._execute( sql, args=None, curs = curs, single = False )
\ No newline at end of file
+        self._execute( sql, args=None, curs = curs, single = False )
+
+def stageBrowserDatabase( browser, filename, mark, stagingPath ):
+    """
+    Process pool worker: import visits newer than mark ( visit id, visit time ) from a browser database
+    into a new staging database at stagingPath, returns stagingPath
+    """
+    stager = datamgr( None )
+    stager.openDb( stagingPath )
+    stager.applyImportPragmas( )
+    stager.executeSqlScript( datamgr.SQL_CREATE_IMPORTED )
+    stager.executeSqlScript( datamgr.SQL_CREATE_URLS )
+    stager.executeSqlScript( datamgr.SQL_CREATE_IMPORT_SOURCES )
+    stager.executeSql( datamgr.SQL_UPDATE_IMPORT_SOURCE, ( browser, os.path.abspath( filename ) ) + tuple( mark ) )
+    stager.conn( ).commit( )
+    stager.importBrowserDatabase( browser, filename )
+    stager.closeConn( )
+
+    return stagingPath
@@ -5,9 +5,14 @@ import re
 import sys
 import os.path
 import time
+import queue
 import random
+import socket
+import asyncio
+import threading
 from datetime import *
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException, TimeoutException
 
 # prog imports
 import user
@@ -17,6 +22,11 @@ import datamgr
 import handlers
 import selfies
 import historian
+import planner
+import fetcher
+import scheduler
+import browsermgr
+import coordinator
 
 class dirtyboots( ):
     """
@@ -24,24 +34,50 @@ class dirtyboots( ):
     in a similar manner to existing browsing history
     """
     commands = {
-        'initdb':   'Creates database for browsing history and stats',
-        'cleardb':  'Clears existing browsing history database',
-        'importdb': 'Imports a web browser\'s history',
-        'config':   'Create a default configuration file',
-        'run':      'Run %(prog)s',
-        'txt':      'Run %(prog)s from a newline-delimited text file of urls'
+        'initdb':     'Creates database for browsing history and stats',
+        'cleardb':    'Clears existing browsing history database',
+        'importdb':   'Imports a web browser\'s history',
+        'plan':       'Compile days of browsing into a visit plan file',
+        'replay':     'Replay browsing history with its original timing',
+        'config':     'Create a default configuration file',
+        'coordinate': 'Serve seed urls and the browsing rate to run --coordinator nodes',
+        'run':        'Run %(prog)s',
+        'txt':        'Run %(prog)s from a newline-delimited text file of urls'
     }
 
     # program consts
     PROG_NAME = 'dirtyboots'
 
+    # seconds a replay may fall behind its schedule before the schedule is shifted
+    REPLAY_MAX_LAG_SEC = 60
+
+    # chance of following a click chain to a next page of the same site, and the longest chain followed
+    CLICK_CHAIN_PROB = 0.5
+    CLICK_CHAIN_MAX = 5
+
+    # most blocking browser calls run at once across browsing sessions
+    MAX_SESSION_CALLS = 16
+
+    # how plain pages are visited, http fetches them without a browser unless they're on the browser list
+    VISIT_BACKENDS = [ 'browser', 'http' ]
+
+    # webdriver page load strategies: wait for the load event, for the DOM, or not at all
+    PAGE_LOAD_STRATEGIES = [ 'normal', 'eager', 'none' ]
+
+    # seconds a leased url may start late before it is returned to the coordinator for another node
+    LEASE_LATE_GRACE_SEC = 60
+
+    # times an unreachable coordinator is retried, and the wait between tries, before a node stops
+    COORDINATOR_RETRIES = 12
+    COORDINATOR_RETRY_SEC = 5
+
     def __init__( self ):
         """
         Do argument setup / description, and execute subcommand
         """
         cmdStr = ''
         for cmd, desc in sorted( self.commands.items() ):
-            cmdStr += '  %s%s\n' % ( cmd.ljust( 10, ' ' ), desc )
+            cmdStr += '  %s%s\n' % ( cmd.ljust( 12, ' ' ), desc )
 
         parser = argparse.ArgumentParser( prog = self.PROG_NAME, description = '', usage = '''%(prog)s <command> [<args>]
 
@@ -62,18 +98,33 @@ The most commonly used %(prog)s commands are:
         self.historian = historian.historian( self )
         self.configParser = conf.conf( ).genDefault( )
         self.txtFile = False
+        self.coordinated = False
         self.skipHandling = False
         self.browsers = { }
+        self.scheduler = None
+        self.sessions = [ ]
+        self.sessionHistorian = None
+        self.statsLock = threading.Lock( )
+        self.urlQueue = None
+        self.workerResults = None
+        self.secPerUrl = 0
         self.urllist = [ ]
         self.blacklist = [ ]
         self.whitelist = [ ]
+        self.browserlist = [ ]
+        self.deadlinelist = [ ]
         self.stats = {
             'tick': datetime.now( ),
             'tock': None,
             'visited': 0,
             'skipped': 0,
-            'handled': 0
+            'handled': 0,
+            'restarts': 0,
+            'restartFailures': 0,
+            'timeouts': 0,
+            'fetchErrors': 0
         }
+        self.mainSession = self.newSession( self.browsers, self.stats )
 
         # use CLI command == function name, use it
         getattr( self, args.command )( )
@@ -100,16 +151,24 @@ The most commonly used %(prog)s commands are:
         c = conf.conf
         parser = argparse.ArgumentParser( description = 'Import database for browsing history and stats',
                                           formatter_class = argparse.ArgumentDefaultsHelpFormatter,
-                                          usage = '%(prog)s importdb [database]' )
-        parser.add_argument( 'database', action = 'store', help = 'Browser database file (places.sqlite/History)' )
-        parser.add_argument( '--browser', action = 'store', choices = [ 'firefox', 'chrome' ],
-                             help = 'Browser database type', default = c.OPTION_DEFAULT_BROWSER_DEFAULT )
+                                          usage = '%(prog)s importdb [database ...]' )
+        parser.add_argument( 'database', action = 'store', nargs = '+',
+                             help = 'Browser database files (places.sqlite/History) or directories to search' )
+        parser.add_argument( '--browser', action = 'store', choices = [ 'auto', 'firefox', 'chrome' ],
+                             help = 'Browser database type, detected per file with auto', default = 'auto' )
+        parser.add_argument( '--affected-only', action = 'store_true',
+                             help = 'Only rebuild working history rows touched by this import', default = False )
+        parser.add_argument( '--workers', action = 'store', type = int, dest = 'import_workers',
+                             help = 'Number of processes reading browser databases, 0 for the CPU count',
+                             default = c.OPTION_IMPORT_WORKERS_DEFAULT )
         self.addConfigParserArgs( parser )
         self.addLocationParserArgs( parser )
         self.addLogParserArgs( parser )
         args = self.parseAndMergeArgs( parser )
         self.dataMgr.openDb( self.getConf( c.OPTIONS, c.OPTION_HISTORY_DB ) )
-        self.dataMgr.importDatabase( args.browser, args.database )
+        sources = self.dataMgr.findBrowserDatabases( args.database, args.browser )
+        workers = int( self.getConf( c.OPTIONS, c.OPTION_IMPORT_WORKERS ) ) or os.cpu_count( )
+        self.dataMgr.importDatabases( sources, args.affected_only, workers )
         self.shutdown( )
 
     def cleardb( self ):
@@ -139,6 +198,86 @@ The most commonly used %(prog)s commands are:
         conf.conf( ).initConf( args.config )
         print( 'Generated default configuration file: %s' % args.config )
 
+    def coordinate( self ):
+        """
+        Own the history database, seed data and browsing rate for nodes started with run --coordinator
+        """
+        c = conf.conf
+        parser = argparse.ArgumentParser( description = 'Serve seed urls and the browsing rate to run --coordinator nodes',
+                                          formatter_class = argparse.ArgumentDefaultsHelpFormatter,
+                                          usage = '%(prog)s coordinate' )
+        parser.add_argument( '--listen', action = 'store', help = 'Address to serve nodes on, host:port or unix:/path',
+                             default = c.OPTION_COORDINATOR_LISTEN_DEFAULT )
+        parser.add_argument( '--seed-engine', action = 'store', choices = historian.historian.SEED_ENGINES,
+                             help = 'Load seed data into memory with numpy, or query it from the database',
+                             default = c.OPTION_SEED_ENGINE_DEFAULT )
+        self.addConfigParserArgs( parser )
+        self.addLocationParserArgs( parser )
+        self.addLogParserArgs( parser )
+        args = self.parseAndMergeArgs( parser )
+        self.openHistory( )
+
+        coordinator.coordinator( self.historian ).serve( self.getConf( c.OPTIONS, c.OPTION_COORDINATOR_LISTEN ) )
+        self.shutdown( )
+
+    def plan( self ):
+        """
+        Compile days of browsing into a visit plan file that can be inspected and run later
+        """
+        parser = argparse.ArgumentParser( description = 'Compile days of browsing into a visit plan file',
+                                          formatter_class = argparse.ArgumentDefaultsHelpFormatter,
+                                          usage = '%(prog)s plan [output]' )
+        parser.add_argument( 'output', action = 'store', nargs = '?', help = 'CSV plan file to write',
+                             default = 'plan.csv' )
+        parser.add_argument( '--start', action = 'store', help = 'First day to plan (YYYY-MM-DD)',
+                             default = date.today( ).isoformat( ) )
+        parser.add_argument( '--days', action = 'store', type = int, help = 'Number of days to plan', default = 1 )
+        self.addConfigParserArgs( parser )
+        self.addLocationParserArgs( parser )
+        self.addLogParserArgs( parser )
+        args = self.parseAndMergeArgs( parser )
+        self.openHistory( )
+
+        visitPlan = planner.planner( self.historian, handlers.handlers )
+        visitPlan.compile( date.fromisoformat( args.start ), args.days )
+        visitPlan.export( args.output )
+        self.shutdown( )
+
+    def replay( self ):
+        """
+        Replay the browsing history of a time range, with its original gaps between visits
+        """
+        c = conf.conf
+        parser = argparse.ArgumentParser( description = 'Replay browsing history with its original timing',
+                                          formatter_class = argparse.ArgumentDefaultsHelpFormatter,
+                                          usage = '%(prog)s replay' )
+        parser.add_argument( '--since', action = 'store', default = None,
+                             help = 'Replay history from this UTC date/time, defaults to HistoryWindowDays ago' )
+        parser.add_argument( '--until', action = 'store', default = '9999-12-31',
+                             help = 'Replay history before this UTC date/time' )
+        parser.add_argument( '--pattern', action = 'store', default = '',
+                             help = 'Only replay urls matching this SQL LIKE pattern, ex: %%duckduckgo.com/%%' )
+        parser.add_argument( '--speed', action = 'store', type = float, default = 1.0,
+                             help = 'Replay speed factor, ex: 2 halves every gap, 0 replays without waiting' )
+        self.addConfigParserArgs( parser )
+        self.addLocationParserArgs( parser )
+        self.addRunParserArgs( parser )
+        self.addLogParserArgs( parser )
+        args = self.parseAndMergeArgs( parser )
+        self.skipHandling = args.skip_urls
+
+        # replays don't need seed data
+        self.runBootstrap( seeded = False )
+        self.user.waitUntil( args.start )
+
+        since = args.since
+        if since is None:
+            days = int( self.getConf( c.OPTIONS, c.OPTION_WINDOW_DAYS ) )
+            since = ( date.today( ) - timedelta( days ) ).isoformat( )
+
+        self.replayHistory( since, args.until, args.pattern, args.speed )
+        self.shutdown( )
+
     def txt( self ):
         """
         Browse the internet similar to run(), except do not use the history database,
@@ -161,12 +300,20 @@ The most commonly used %(prog)s commands are:
         self.addConfigParserArgs( parser )
         self.addLocationParserArgs( parser )
         self.addRunParserArgs( parser )
+        if not self.txtFile:
+            parser.add_argument( '--coordinator', action = 'store', default = None,
+                                 help = 'Browse urls leased from a coordinate process at host:port or unix:/path' )
         self.addLogParserArgs( parser )
         args = self.parseAndMergeArgs( parser )
         self.skipHandling = args.skip_urls
+        self.coordinated = bool( getattr( args, 'coordinator', None ) )
+        if self.coordinated and args.plan:
+            parser.error( '--plan and --coordinator can\'t be combined' )
 
-        # setup data manager and browser
-        self.runBootstrap( )
+        # setup data manager and browser, browsing sessions and http visits start browsers when they need one.
+        # coordinated nodes get their urls from the coordinator, which owns the history database
+        workers = 1 if args.plan else int( self.getConf( conf.conf.OPTIONS, conf.conf.OPTION_WORKERS ) )
+        self.runBootstrap( startBrowser = workers < 2 and not self.visitsOverHttp( ), history = not self.coordinated )
 
         if self.txtFile:
             self.urllist = self.loadList( args.txtFile )
@@ -175,9 +322,12 @@ The most commonly used %(prog)s commands are:
         self.user.waitUntil( args.start )
 
         # begin magic
-        # self.urlHistory( )
-        # self.urlHistory( '%duckduckgo.com/%' )
-        self.simulateRealtime( )
+        if args.plan:
+            self.runPlan( args.plan )
+        elif self.coordinated:
+            self.runCoordinated( args.coordinator, workers )
+        else:
+            self.simulateRealtime( workers )
 
         # memories to last a lifetime
         if self.getConf( conf.conf.OPTIONS, conf.conf.OPTION_SELFIES ) == 'True':
@@ -189,7 +339,7 @@ The most commonly used %(prog)s commands are:
         # Shuuuut iiit doooooown
         self.shutdown( )
 
-    def runBootstrap( self ):
+    def runBootstrap( self, seeded = True, startBrowser = True, history = True ):
         """
         Setup configs, args, users, and browsers based on CLI args and .conf files
         """
@@ -198,20 +348,44 @@ The most commonly used %(prog)s commands are:
         # load white/black lists
         self.loadLists( )
 
-        # load database with data manager
-        self.dataMgr.openDb( self.getConf( c.OPTIONS, c.OPTION_HISTORY_DB ) )
+        # load database and seed data, seed data for text-file runs comes from the file
+        seeded = seeded and history and not self.txtFile
+        if history:
+            self.openHistory( seeded )
+        if seeded:
+            self.historian.startPrefetch( self.getConf( c.OPTIONS, c.OPTION_HISTORY_DB ) )
 
         # set the browser
-        self.setBrowser( self.getConf( c.OPTIONS, c.OPTION_DEFAULT_BROWSER ) )
+        if startBrowser:
+            self.setBrowser( self.getConf( c.OPTIONS, c.OPTION_DEFAULT_BROWSER ) )
+        else:
+            self.defaultBrowser = self.getConf( c.OPTIONS, c.OPTION_DEFAULT_BROWSER )
+
+    def openHistory( self, seeded = True ):
+        """
+        Open the history database, upgrading tables made by older versions, and load seed data
+        """
+        c = conf.conf
+        self.dataMgr.openDb( self.getConf( c.OPTIONS, c.OPTION_HISTORY_DB ) )
+        if self.dataMgr.ensureDbTables( ):
+            self.dataMgr.rebuildUrlHistoryTable( )
+
+        if seeded and not self.txtFile:
+            self.historian.loadSeedEngine( self.getConf( c.OPTIONS, c.OPTION_SEED_ENGINE ) )
 
     def shutdown( self ):
         """
         Close the active browsers and shut down database connections
         """
+        self.stopWorkers( )
         self.stats[ 'tock' ] = datetime.now( )
-        for browserStr in self.browsers:
-            self.browser( browserStr ).quit( )
-        self.dataMgr.closeConn( )
+        for browserMgr in self.browsers.values( ):
+            browserMgr.quit( )
+        if self.mainSession[ 'fetcher' ]:
+            self.mainSession[ 'fetcher' ].close( )
+        self.historian.stopPrefetch( )
+        if self.dataMgr.isOpen( ):
+            self.dataMgr.closeConn( )
 
         # debugging purposes
         # dblog.logSandwich( 'visited/handled urls' )
@@ -282,6 +456,31 @@ The most commonly used %(prog)s commands are:
         parser.add_argument( '--skip-urls', action = 'store_true',
                              help = 'Skip all URLs (still bootstraps and runs stats)',
                              default = False )
+        parser.add_argument( '--plan', action = 'store', help = 'Run a visit plan file made by plan', default = None )
+        parser.add_argument( '--seed-engine', action = 'store', choices = historian.historian.SEED_ENGINES,
+                             help = 'Load seed data into memory with numpy, or query it from the database',
+                             default = c.OPTION_SEED_ENGINE_DEFAULT )
+        parser.add_argument( '--workers', action = 'store', type = int,
+                             help = 'Number of browsers browsing at once, sharing the browsing rate',
+                             default = c.OPTION_WORKERS_DEFAULT )
+        parser.add_argument( '--backend', action = 'store', choices = self.VISIT_BACKENDS,
+                             help = 'Visit plain pages with a browser, or fetch them over http without one',
+                             default = c.OPTION_VISIT_BACKEND_DEFAULT )
+        parser.add_argument( '--browserlist', action = 'store',
+                             help = 'File containing regex of websites that need a browser with the http backend',
+                             default = c.OPTION_BROWSERLIST_DEFAULT )
+        parser.add_argument( '--page-load', action = 'store', choices = self.PAGE_LOAD_STRATEGIES,
+                             help = 'Wait for pages to fully load, for their DOM, or not at all',
+                             default = c.OPTION_PAGE_LOAD_STRATEGY_DEFAULT )
+        parser.add_argument( '--visit-timeout', action = 'store', type = float,
+                             help = 'Seconds a page may load before it is stopped',
+                             default = c.OPTION_VISIT_TIMEOUT_DEFAULT )
+        parser.add_argument( '--deadlinelist', action = 'store',
+                             help = 'File of "<seconds> <regex>" lines, page load deadlines of matching websites',
+                             default = c.OPTION_DEADLINELIST_DEFAULT )
+        parser.add_argument( '--no-resources', action = 'store_true',
+                             help = 'Only fetch pages with the http backend, not their images/scripts/stylesheets',
+                             default = False )
 
     def parseAndMergeArgs( self, parser ):
         """
@@ -353,6 +552,36 @@ The most commonly used %(prog)s commands are:
         if 'selfies' in vArgs:
             self.setConf( c.OPTIONS, c.OPTION_SELFIES, str( args.selfies ) )
 
+        if 'seed_engine' in vArgs:
+            self.setConf( c.OPTIONS, c.OPTION_SEED_ENGINE, args.seed_engine )
+
+        if 'workers' in vArgs:
+            self.setConf( c.OPTIONS, c.OPTION_WORKERS, str( max( 1, args.workers ) ) )
+
+        if 'import_workers' in vArgs:
+            self.setConf( c.OPTIONS, c.OPTION_IMPORT_WORKERS, str( max( 0, args.import_workers ) ) )
+
+        if 'backend' in vArgs:
+            self.setConf( c.OPTIONS, c.OPTION_VISIT_BACKEND, args.backend )
+
+        if 'browserlist' in vArgs:
+            self.setConf( c.OPTIONS, c.OPTION_BROWSERLIST, str( args.browserlist ) )
+
+        if 'page_load' in vArgs:
+            self.setConf( c.OPTIONS, c.OPTION_PAGE_LOAD_STRATEGY, args.page_load )
+
+        if 'visit_timeout' in vArgs:
+            self.setConf( c.OPTIONS, c.OPTION_VISIT_TIMEOUT, str( args.visit_timeout ) )
+
+        if 'listen' in vArgs:
+            self.setConf( c.OPTIONS, c.OPTION_COORDINATOR_LISTEN, args.listen )
+
+        if 'deadlinelist' in vArgs:
+            self.setConf( c.OPTIONS, c.OPTION_DEADLINELIST, str( args.deadlinelist ) )
+
+        if 'no_resources' in vArgs:
+            self.setConf( c.OPTIONS, c.OPTION_FETCH_RESOURCES, str( not args.no_resources ) )
+
         # always let the user know what our config values are before running
         # this is useful for reading through logs, regardless of errors/successes
         self.dumpConf( level = logging.INFO )
@@ -373,24 +602,76 @@ The most commonly used %(prog)s commands are:
 
     def browser( self, browserOver = '' ):
         """
-        Returns default browser or specified browser
+        Returns default browser or specified browser, a browsing session's own browsers within a session.
+        Browsers are started the first time they're needed
+        """
+        return self.browserMgr( browserOver ).driver( )
+
+    def browserMgr( self, browserOver = '' ):
+        """
+        Returns the lifecycle manager of the default or specified browser of the browsing session
         """
+        c = conf.conf
         browser = self.defaultBrowser
         if len( browserOver ):
             browser = browserOver
-        return self.browsers[ browser ]
+        browsers = self.sessionContext( )[ 'browsers' ]
+        if browser not in browsers:
+            browsers[ browser ] = browsermgr.browsermgr( browser, self.createBrowser,
+                                                         int( self.getConf( c.OPTIONS, c.OPTION_BROWSER_MAX_PAGES ) ),
+                                                         float( self.getConf( c.OPTIONS, c.OPTION_BROWSER_MAX_RSS ) ),
+                                                         float( self.getConf( c.OPTIONS, c.OPTION_BROWSER_MAX_LOAD ) ) )
+        return browsers[ browser ]
+
+    def pageFetcher( self ):
+        """
+        Returns the http fetcher of the browsing session, started the first time it's needed
+        """
+        session = self.sessionContext( )
+        if not session[ 'fetcher' ]:
+            c = conf.conf
+            session[ 'fetcher' ] = fetcher.fetcher( self.defaultBrowser,
+                                                    self.getConf( c.OPTIONS, c.OPTION_FETCH_RESOURCES ) == 'True' )
+        return session[ 'fetcher' ]
+
+    def sessionContext( self ):
+        """
+        Browsers, http fetcher and stats of the browsing session this code runs for, the main session outside of one
+        """
+        session = self.scheduler.context( ) if self.scheduler else None
+        return session or self.mainSession
 
     def setBrowser( self, browserName ):
         """
         Creates a browser instance
         """
         self.defaultBrowser = browserName
+        self.browserMgr( browserName ).driver( )
+
+    def createBrowser( self, browserName ):
+        """
+        Starts a webdriver for a browser name, with the configured page load strategy
+        """
+        strategy = self.getConf( conf.conf.OPTIONS, conf.conf.OPTION_PAGE_LOAD_STRATEGY )
         if browserName == 'firefox':
-            self.browsers[ 'firefox' ] = webdriver.Firefox( )
+            caps = webdriver.DesiredCapabilities.FIREFOX.copy( )
+            caps[ 'pageLoadStrategy' ] = strategy
+            return webdriver.Firefox( desired_capabilities = caps )
         elif browserName == 'chrome':
-            self.browsers[ 'chrome' ] = webdriver.Chrome( )
+            caps = webdriver.DesiredCapabilities.CHROME.copy( )
+            caps[ 'pageLoadStrategy' ] = strategy
+            return webdriver.Chrome( desired_capabilities = caps )
         elif browserName == 'ie':
-            self.browsers[ 'ie' ] = webdriver.Ie( )
+            caps = webdriver.DesiredCapabilities.INTERNETEXPLORER.copy( )
+            caps[ 'pageLoadStrategy' ] = strategy
+            return webdriver.Ie( desired_capabilities = caps )
+
+    def newSession( self, browsers, stats ):
+        """
+        A browsing session's context: its browsers, http fetcher, stats, the page load deadline of the handler
+        it is running, and the seconds spent waiting on pages for the current url
+        """
+        return { 'browsers': browsers, 'stats': stats, 'fetcher': None, 'handlerDeadline': None, 'loadSec': 0 }
 
     def loadList( self, filename ):
         """
@@ -407,25 +688,50 @@ The most commonly used %(prog)s commands are:
 
     def loadLists( self ):
         """
-        Load the white and black lists
+        Load the white, black, browser and deadline lists
         """
         c = conf.conf
         self.blacklist = self.loadList( self.getConf( c.OPTIONS, c.OPTION_BLACKLIST ) )
         self.whitelist = self.loadList( self.getConf( c.OPTIONS, c.OPTION_WHITELIST ) )
+        self.browserlist = self.loadList( self.getConf( c.OPTIONS, c.OPTION_BROWSERLIST ) )
+        self.deadlinelist = self.loadDeadlineList( self.getConf( c.OPTIONS, c.OPTION_DEADLINELIST ) )
+
+    def loadDeadlineList( self, filename ):
+        """
+        Load page load deadlines from "<seconds> <regex>" lines, returns a list of ( seconds, pattern )
+        """
+        deadlines = [ ]
+        for line in self.loadList( filename ):
+            ( seconds, _, regex ) = line.strip( ).partition( ' ' )
+            try:
+                deadlines.append( ( float( seconds ), re.compile( regex.strip( ) ) ) )
+            except ( ValueError, re.error ):
+                if line.strip( ):
+                    dblog.log( 'list', 'Ignoring deadline [ %s ]' % line, level = logging.WARNING )
+
+        return deadlines
 
     # Main 'Run' Actions
-    def simulateRealtime( self ):
+    def simulateRealtime( self, workers = 1 ):
         """
-        Use current date/time to build a "typical" browsing pattern
+        Use current date/time to build a "typical" browsing pattern.
+        With more than one worker, urls are queued for browsing sessions that split the browsing rate
         """
+        if workers > 1:
+            self.startWorkers( workers )
+
         # continuously loop, refreshing the seed data as needed
         expiresDtm  = None
+        nextSeed    = None
+        chainUrl    = None
+        chainLen    = 0
         processUrls = True
         while processUrls:
             # first up, get history if our time block is up
             now = datetime.now()
             if ( expiresDtm is None ) or ( now >= expiresDtm ):
                 failures = 0
+                seedDtm = expiresDtm
                 expiresDtm = now + timedelta( minutes = 30 )
                 dblog.log( 'sim', 'Refreshing seed data, valid until %s' % expiresDtm )
                 if self.txtFile:
@@ -435,8 +741,12 @@ The most commonly used %(prog)s commands are:
                     urlRows = self.urllist.copy()
                     ratePerHalfHour = random.uniform( 150, 500 )
                 else:
-                    # refresh from the database
-                    ( urlRows, ratePerHalfHour ) = self.historian.getSeedUrlData( now )
+                    # swap in the seed data prefetched for this window, computing it here only at startup,
+                    # when urls ran out early, or if the prefetch failed
+                    ( urlRows, ratePerHalfHour ) = self.takePrefetchedSeed( nextSeed, seedDtm, now )
+
+                    # and start computing the next window's seed data while we browse this one
+                    nextSeed = self.historian.prefetchSeedUrlData( expiresDtm )
 
                 # if there are no URL results foudn, we have to go home
                 urlRowsOrigLen = len( urlRows )
@@ -446,20 +756,42 @@ The most commonly used %(prog)s commands are:
 
                 # convert 30-min rate to secs/url
                 secPerUrl = round( 60 / ( ratePerHalfHour / 30 ), 2 )
+                self.secPerUrl = secPerUrl
 
-            # pick a random item in the urls
-            idx = int( random.uniform( 0, len( urlRows ) ) )
-
-            # remove it so it's not seen again
-            urlRow = urlRows.pop( idx )
-            url = urlRow[ 'url' ] if not self.txtFile else urlRow
+            if chainUrl:
+                # follow the click chain from the last page
+                url = chainUrl
+                chainLen += 1
+            else:
+                # pick a random item in the urls
+                idx = int( random.uniform( 0, len( urlRows ) ) )
+
+                # remove it so it's not seen again
+                urlRow = urlRows.pop( idx )
+                url = urlRow[ 'url' ] if not self.txtFile else urlRow
+                chainLen = 0
+            chainUrl = None
+            self.mainSession[ 'loadSec' ] = 0
+
+            if workers > 1:
+                # queue it for the next free session, stopping if every session has died
+                if not self.queueUrl( url ):
+                    dblog.log( 'sim', 'All browsing sessions stopped', level = logging.ERROR )
+                    return
+                failures += self.collectWorkerResults( self.workerResults )[ 1 ]
 
             # handle it with our main handler / dispatcher
-            if self.handleUrl( url ):
-                # wait the appropriate amount of time; we'll fudge the time by +/- 25%
+            elif self.handleUrlNow( url ):
+                # sometimes click through to a page that followed this one in the history
+                if not self.txtFile and chainLen < self.CLICK_CHAIN_MAX and random.random( ) < self.CLICK_CHAIN_PROB:
+                    chainUrl = self.historian.getNextUrl( url )
+
+                # wait the appropriate amount of time; we'll fudge the time by +/- 25%,
+                # less the time already spent waiting on pages to load
                 sleepSec = abs( secPerUrl + round( random.choice( [-1,1] ) * ( secPerUrl / 4 ), 2 ) )
+                sleepSec = max( 0, sleepSec - self.mainSession[ 'loadSec' ] )
                 dblog.log( 'sim', 'Finished URL, waiting %d seconds' % sleepSec )
-                self.user.idle( sleepSec )
+                self.user.wait( sleepSec )
             else:
                 failures += 1
 
@@ -470,19 +802,311 @@ The most commonly used %(prog)s commands are:
             # only keep going if we haven't failed on every URL attempt
             processUrls = ( failures < urlRowsOrigLen )
 
-    def urlHistory( self, urlPattern = '' ):
+    def runCoordinated( self, address, workers = 1 ):
+        """
+        Browse batches of urls leased from a coordinator at the times it set. With more than one worker,
+        urls are queued for browsing sessions at those times. Stops once the coordinator can't be reached
+        """
+        client = coordinator.coordclient( address, '%s-%d' % ( socket.gethostname( ), os.getpid( ) ) )
+        if workers > 1:
+            # the coordinator paces the urls, sessions browse them as soon as they're queued
+            self.startWorkers( workers )
+            self.secPerUrl = 0
+
+        dblog.log( 'sim', 'Browsing urls from the coordinator at %s' % address )
+        retries = 0
+        pending = [ ]
+        while True:
+            pending = self.reportLeases( client, pending )
+            try:
+                lease = client.lease( workers )
+                retries = 0
+            except ( OSError, ValueError ) as e:
+                retries += 1
+                if retries > self.COORDINATOR_RETRIES:
+                    dblog.log( 'sim', 'Unable to reach the coordinator (%s), stopping' % e, level = logging.ERROR )
+                    return
+                dblog.log( 'sim', 'Unable to reach the coordinator (%s), retrying' % e, level = logging.WARNING )
+                self.user.wait( self.COORDINATOR_RETRY_SEC )
+                continue
+
+            if not lease[ 'urls' ]:
+                self.user.wait( lease[ 'retry' ] )
+                continue
+
+            ( outcome, running ) = self.browseLease( lease, workers )
+            pending.append( outcome )
+            if not running:
+                dblog.log( 'sim', 'All browsing sessions stopped', level = logging.ERROR )
+                self.reportLeases( client, pending, final = True )
+                return
+
+    def browseLease( self, lease, workers = 1 ):
+        """
+        Browse a lease's urls at their visit times, urls that are too late are returned for other nodes.
+        With more than one worker, urls are queued with the lease's own results queue and counted as the
+        sessions finish them. Returns the lease's outcome, and False if every browsing session stopped
+        """
+        urls = lease[ 'urls' ]
+        outcome = { 'lease': lease[ 'lease' ], 'visited': 0, 'failed': 0, 'returned': [ ], 'queued': 0,
+                    'results': queue.Queue( ) if workers > 1 else None }
+        for ( idx, item ) in enumerate( urls ):
+            wait = item[ 'at' ] - datetime.now( ).timestamp( )
+            if wait > 0:
+                self.user.wait( wait )
+            elif -wait > self.LEASE_LATE_GRACE_SEC:
+                outcome[ 'returned' ].append( item[ 'url' ] )
+                continue
+
+            self.mainSession[ 'loadSec' ] = 0
+            if workers > 1:
+                if not self.queueUrl( item[ 'url' ], outcome[ 'results' ] ):
+                    outcome[ 'returned' ].extend( later[ 'url' ] for later in urls[ idx: ] )
+                    return outcome, False
+                outcome[ 'queued' ] += 1
+            elif self.handleUrlNow( item[ 'url' ] ):
+                outcome[ 'visited' ] += 1
+            else:
+                outcome[ 'failed' ] += 1
+
+        return outcome, True
+
+    def reportLeases( self, client, pending, final = False ):
+        """
+        Report the leases whose queued urls the sessions have all finished, or every lease when final, where
+        urls that never came back count as failed. Returns the leases still being browsed
+        """
+        browsing = [ ]
+        for outcome in pending:
+            ( handled, failed ) = self.collectWorkerResults( outcome[ 'results' ] )
+            outcome[ 'visited' ] += handled
+            outcome[ 'failed' ] += failed
+            outcome[ 'queued' ] -= handled + failed
+            if outcome[ 'queued' ] and not final:
+                browsing.append( outcome )
+                continue
+
+            try:
+                client.report( outcome[ 'lease' ], outcome[ 'visited' ], outcome[ 'failed' ] + outcome[ 'queued' ],
+                               outcome[ 'returned' ] )
+            except ( OSError, ValueError ) as e:
+                dblog.log( 'sim', 'Unable to report lease %d (%s)' % ( outcome[ 'lease' ], e ), level = logging.WARNING )
+
+        return browsing
+
+    def startWorkers( self, workers ):
+        """
+        Start browsing sessions on the scheduler's event loop, fed from a shared url queue
+        """
+        dblog.log( 'sim', 'Starting %d browsing sessions' % workers )
+        self.scheduler = scheduler.scheduler( min( workers, self.MAX_SESSION_CALLS ) )
+        self.scheduler.start( )
+        self.user.scheduler = self.scheduler
+        self.urlQueue = self.scheduler.create( asyncio.Queue, workers )
+        self.workerResults = queue.Queue( )
+        self.sessions = [ self.scheduler.submit( self.browseSession( workerId, workers ) )
+                          for workerId in range( workers ) ]
+
+    def stopWorkers( self ):
+        """
+        Wake the sessions, let them finish their current urls and close their browsers, then stop the scheduler.
+        Urls still queued are dropped
+        """
+        if not self.scheduler:
+            return
+
+        self.scheduler.stopSessions( )
+        for session in self.sessions:
+            self.queueUrl( None )
+        for session in self.sessions:
+            try:
+                session.result( )
+            except Exception as e:
+                dblog.log( 'sim', 'Browsing session failed: %s' % e, level = logging.ERROR )
+        self.scheduler.submit( self.closeSessionHistorian( ) ).result( )
+
+        self.scheduler.stop( )
+        self.user.scheduler = None
+        self.scheduler = None
+        self.sessions = [ ]
+
+    def queueUrl( self, url, results = None ):
+        """
+        Queue a url for the sessions, waiting for room while any session is running. Returns False if none are.
+        Whether the url was handled goes to results, workerResults by default
+        """
+        item = ( url, results or self.workerResults )
+        while any( not session.done( ) for session in self.sessions ):
+            try:
+                self.scheduler.submit( asyncio.wait_for( self.urlQueue.put( item ), 1 ) ).result( )
+                return True
+            except asyncio.TimeoutError:
+                pass
+
+        return False
+
+    def collectWorkerResults( self, results ):
+        """
+        Returns how many urls of a results queue the sessions handled and failed to handle since the last collection
+        """
+        ( handled, failed ) = ( 0, 0 )
+        while results is not None:
+            try:
+                if results.get_nowait( ):
+                    handled += 1
+                else:
+                    failed += 1
+            except queue.Empty:
+                break
+
+        return handled, failed
+
+    async def browseSession( self, workerId, workers ):
         """
-        Use the full chronological url history (or just matching a pattern)
-        to replay a sequence of urls
+        Event loop: browse queued urls with the session's own browser until a None url, waiting
+        between urls as if browsing its share of the rate. Stats are merged into self.stats at the end
         """
-        days = int( self.getConf( conf.conf.OPTIONS, conf.conf.OPTION_WINDOW_DAYS ) )
-        histRows = self.historian.getUrlHistory( days, urlPattern )
+        sched = self.scheduler
+        context = self.newSession( { }, { 'visited': 0, 'skipped': 0, 'handled': 0, 'restarts': 0,
+                                                  'restartFailures': 0, 'timeouts': 0, 'fetchErrors': 0 } )
+        sched.enter( context )
 
-        for histRow in histRows:
-            self.handleUrl( histRow[ 'url' ] )
+        chainUrl = None
+        chainLen = 0
+        try:
+            while not sched.isStopping( ):
+                if chainUrl:
+                    url = chainUrl
+                    chainLen += 1
+                else:
+                    ( url, results ) = await self.urlQueue.get( )
+                    if url is None:
+                        break
+                    chainLen = 0
+                chainUrl = None
+
+                # one bad page shouldn't take down the session's browser
+                context[ 'loadSec' ] = 0
+                try:
+                    handled = await self.handleUrl( url )
+                except Exception as e:
+                    dblog.log( 'sim', 'Session %d failed on [ %s ]: %s' % ( workerId, url, e ), level = logging.ERROR )
+                    handled = False
+                results.put( handled )
+
+                if handled:
+                    if not self.txtFile and not self.coordinated and chainLen < self.CLICK_CHAIN_MAX and random.random( ) < self.CLICK_CHAIN_PROB:
+                        chainUrl = self.getSessionHistorian( ).getNextUrl( url )
+
+                    # each session browses 1/workers of the rate; we'll fudge the time by +/- 25%,
+                    # less the time already spent waiting on pages to load
+                    secPerUrl = workers * self.secPerUrl
+                    sleepSec = abs( secPerUrl + round( random.choice( [-1,1] ) * ( secPerUrl / 4 ), 2 ) )
+                    sleepSec = max( 0, sleepSec - context[ 'loadSec' ] )
+                    dblog.log( 'sim', 'Session %d finished URL, waiting %d seconds' % ( workerId, sleepSec ) )
+                    await sched.idle( sleepSec )
+        finally:
+            for browserMgr in context[ 'browsers' ].values( ):
+                await sched.call( browserMgr.quit )
+            if context[ 'fetcher' ]:
+                context[ 'fetcher' ].close( )
+
+            stats = context[ 'stats' ]
+            with self.statsLock:
+                for ( key, count ) in stats.items( ):
+                    self.stats[ key ] += count
+            dblog.log( 'sim', 'Session %d finished: %d visited, %d handled, %d skipped, %d browser restarts, %d failed '
+                              'restarts, %d timeouts, %d fetch errors' % (
+                                  workerId, stats[ 'visited' ], stats[ 'handled' ], stats[ 'skipped' ], stats[ 'restarts' ],
+                                  stats[ 'restartFailures' ], stats[ 'timeouts' ], stats[ 'fetchErrors' ] ) )
+
+    def getSessionHistorian( self ):
+        """
+        Event loop: historian with its own connection for the sessions' click chain lookups
+        """
+        if not self.sessionHistorian:
+            dataMgr = datamgr.datamgr( self )
+            dataMgr.openDb( self.getConf( conf.conf.OPTIONS, conf.conf.OPTION_HISTORY_DB ) )
+            self.sessionHistorian = historian.historian( self, random.Random( ), dataMgr )
+
+        return self.sessionHistorian
+
+    async def closeSessionHistorian( self ):
+        """
+        Event loop: close the sessions' historian connection
+        """
+        if self.sessionHistorian:
+            self.sessionHistorian.dataMgr( ).closeConn( )
+            self.sessionHistorian = None
+
+    def runPlan( self, filename ):
+        """
+        Browse the visits of a plan file at their planned times
+        """
+        visitPlan = planner.planner( self.historian, handlers.handlers )
+        visitPlan.load( filename )
+        visitPlan.run( self.handleUrlNow, self.user.wait )
+
+    def takePrefetchedSeed( self, nextSeed, seedDtm, now ):
+        """
+        Returns the prefetched ( urlRows, ratePerHalfHour ) if it was computed for a window that has started,
+        otherwise computes seed data for now
+        """
+        if nextSeed is not None and seedDtm is not None and now >= seedDtm:
+            try:
+                return nextSeed.result( )
+            except Exception as e:
+                dblog.log( 'sim', 'Prefetching seed data failed (%s), refreshing from the database' % e,
+                           level = logging.WARNING )
+        elif nextSeed is not None:
+            nextSeed.cancel( )
+
+        return self.historian.getSeedUrlData( now )
+
+    def replayHistory( self, since, until, urlPattern = '', speed = 1.0 ):
+        """
+        Use the chronological url history from since up to until (or just matching a pattern)
+        to replay a sequence of urls. Visits are timed against their original offsets from the first visit,
+        divided by speed, so gaps stay faithful without drifting; speed 0 replays without waiting
+        """
+        dblog.log( 'replay', 'Replaying history from %s to %s at %sx' % ( since, until, speed ) )
+        replayed = 0
+        startTs = None
+        for histRow in self.historian.iterUrlHistory( since, until, urlPattern ):
+            visitTs = datetime.fromisoformat( histRow[ 'timestamp' ] ).timestamp( )
+            if speed > 0:
+                if startTs is None:
+                    ( startTs, startTick ) = ( visitTs, datetime.now( ).timestamp( ) )
+
+                wait = startTick + ( visitTs - startTs ) / speed - datetime.now( ).timestamp( )
+                if wait > 0:
+                    self.user.wait( wait )
+                elif wait < -self.REPLAY_MAX_LAG_SEC:
+                    # a slow visit put us far behind, shift the schedule rather than bursting to catch up
+                    startTick -= wait
+
+            self.handleUrlNow( histRow[ 'url' ] )
+            replayed += 1
+
+        dblog.log( 'replay', 'Replayed %d urls' % replayed )
 
     # URL Handlers
-    def handleUrl( self, url ):
+    def handleUrlNow( self, url ):
+        """
+        Handle a url on this thread for the main session, returns whether it was handled
+        """
+        return asyncio.run( self.handleUrl( url ) )
+
+    async def call( self, func, *args ):
+        """
+        Run a blocking browser/http call, on the scheduler's executor within a browsing session
+        """
+        if self.scheduler and self.scheduler.context( ) is not None:
+            return await self.scheduler.call( func, *args )
+
+        return func( *args )
+
+    async def handleUrl( self, url ):
         """
         Given a URL, check if the URL is valid for handling/visiting
         If it can be handled, execute the handler, otherwise visit the page
@@ -509,18 +1133,48 @@ The most commonly used %(prog)s commands are:
             self.skipUrl( url, '!list' )
             return False
 
-        # check handlers
-        for handler in handlers.handlers:
-            if self.tryUrlHandler( url, handler ):
-                return True
+        try:
+            # check handlers
+            for handler in handlers.handlers:
+                if await self.tryUrlHandler( url, handler ):
+                    return True
+
+            # by default just visit the page, over http if it doesn't need a browser
+            if self.visitsOverHttp( url ):
+                if not await self.call( self.fetchUrl, url ):
+                    return False
+            else:
+                await self.call( self.visitUrl, url )
+        except WebDriverException as e:
+            await self.call( self.browserFailed, url, e )
+            return False
 
-        # by default just visit the page
-        self.visitUrl( url )
-        self.user.pause( )
-        self.postHandleUrl( url )
+        await self.user.pause( )
+        await self.call( self.postHandleUrl, url )
 
         return True
 
+    def browserFailed( self, url, error ):
+        """
+        A browser call failed on a url, respawn the browser if its driver died so browsing carries on.
+        A respawn that fails leaves no browser, and the next url tries to start one again
+        """
+        browserMgr = self.browserMgr( )
+        if browserMgr.alive( ):
+            dblog.log( 'visit', 'Browser error on [ %s ]: %s' % ( url, str( error ).strip( ) ), level = logging.WARNING )
+            return
+
+        dblog.log( 'visit', 'Browser died on [ %s ], respawning: %s' % ( url, str( error ).strip( ) ), level = logging.ERROR )
+        try:
+            browserMgr.restart( 'crash' )
+        except Exception as e:
+            dblog.log( 'visit', 'Unable to respawn %s, retrying on the next url: %s' % ( browserMgr.browserName,
+                                                                                      str( e ).strip( ) ), level = logging.ERROR )
+            self.countStat( 'restartFailures' )
+            return
+
+        self.countStat( 'restarts' )
+
     def postHandleUrl( self, url ):
         """
         Do any post-url handling clean up or features that should be executed once we consider a url visit "done"
@@ -531,19 +1185,18 @@ The most commonly used %(prog)s commands are:
 
         # check if we're concerned about keeping a log of previous urls
         if self.getConf( conf.conf.OPTIONS, conf.conf.OPTION_NO_REPEATS ) == 'True':
-            if url not in self.processedUrls:
-                self.processedUrls[ url ] = list( )
-                # guaranteed to have an initialized list, append the timestamp to represent this URL instance
-            self.processedUrls[ url ].append( datetime.now( ) )
+            # setdefault keeps this safe when browsing sessions finish the same url at once
+            # guaranteed to have an initialized list, append the timestamp to represent this URL instance
+            self.processedUrls.setdefault( url, list( ) ).append( datetime.now( ) )
 
     def skipUrl( self, url, reason = 'skip' ):
         """
         Skip a URL and log it
         """
         dblog.log( reason, url )
-        self.stats[ 'skipped' ] += 1
+        self.countStat( 'skipped' )
 
-    def tryUrlHandler( self, url, handler ):
+    async def tryUrlHandler( self, url, handler ):
         """
         Try a regex-handleFunc pair for the URL
         """
@@ -553,11 +1206,16 @@ The most commonly used %(prog)s commands are:
         if len( match ):
             handleFunc = handler[ 1 ]
             dblog.log( 'handler', "'%s' handling url [ %s ]" % ( handleFunc.__name__, url ) )
-            # use the handler and the regex match for the URL
-            handleFunc( self, url, match )
+            # use the handler and the regex match for the URL, under the handler's page load deadline
+            session = self.sessionContext( )
+            session[ 'handlerDeadline' ] = handlers.deadlines.get( handleFunc )
+            try:
+                await handleFunc( self, url, match )
+            finally:
+                session[ 'handlerDeadline' ] = None
             # mark it handled and move on
-            self.stats[ 'handled' ] += 1
-            self.postHandleUrl( url )
+            self.countStat( 'handled' )
+            await self.call( self.postHandleUrl, url )
             return True
 
         return False
@@ -567,8 +1225,73 @@ The most commonly used %(prog)s commands are:
         Visit a url with the browser
         """
         dblog.log( 'visit', url )
-        self.browser( ).get( url )
-        self.stats[ 'visited' ] += 1
+        browserMgr = self.browserMgr( )
+        if browserMgr.recycleIfNeeded( ):
+            self.countStat( 'restarts' )
+
+        deadline = self.visitDeadline( url )
+        browserMgr.setPageLoadTimeout( deadline )
+        tick = datetime.now( ).timestamp( )
+        try:
+            browserMgr.driver( ).get( url )
+        except TimeoutException:
+            # stop whatever is still loading, the page is as loaded as it's going to get
+            dblog.log( 'visit', 'Stopped loading [ %s ] after %ss' % ( url, deadline ), level = logging.WARNING )
+            browserMgr.driver( ).execute_script( 'window.stop();' )
+            self.countStat( 'timeouts' )
+        loadSec = datetime.now( ).timestamp( ) - tick
+        browserMgr.pageLoaded( loadSec )
+        self.sessionContext( )[ 'loadSec' ] += loadSec
+        self.countStat( 'visited' )
+
+    def visitDeadline( self, url ):
+        """
+        Seconds a url's page may load: from the deadline list, else the running handler's deadline, else the default
+        """
+        for ( seconds, pattern ) in self.deadlinelist:
+            if pattern.search( url ):
+                return seconds
+
+        handlerDeadline = self.sessionContext( )[ 'handlerDeadline' ]
+        if handlerDeadline:
+            return handlerDeadline
+
+        return float( self.getConf( conf.conf.OPTIONS, conf.conf.OPTION_VISIT_TIMEOUT ) )
+
+    def fetchUrl( self, url ):
+        """
+        Visit a url over http, with its page resources, without a browser.
+        Returns False if the page couldn't be fetched or the server failed on it
+        """
+        dblog.log( 'fetch', url )
+        tick = datetime.now( ).timestamp( )
+        status = self.pageFetcher( ).fetch( url )
+        self.sessionContext( )[ 'loadSec' ] += datetime.now( ).timestamp( ) - tick
+        if status is None or status >= 500:
+            self.countStat( 'fetchErrors' )
+            return False
+
+        self.countStat( 'visited' )
+        return True
+
+    def visitsOverHttp( self, url = '' ):
+        """
+        True if plain pages, or a url, are visited over http instead of with a browser.
+        Selfies need a browser's screenshots, and urls on the browser list always get a browser
+        """
+        c = conf.conf
+        if self.getConf( c.OPTIONS, c.OPTION_VISIT_BACKEND ) != 'http':
+            return False
+        if self.getConf( c.OPTIONS, c.OPTION_SELFIES ) == 'True':
+            return False
+
+        return not ( url and self.urlHasListMatch( self.browserlist, url ) )
+
+    def countStat( self, key ):
+        """
+        Count a url stat, in the session's own stats within a browsing session
+        """
+        self.sessionContext( )[ 'stats' ][ key ] += 1
 
     # Utility Functions
     def urlHasListMatch( self, list, url ):
@@ -617,7 +1340,7 @@ The most commonly used %(prog)s commands are:
         # shouldn't ever get here ...
         return False
 
-    def typeKeys( self, inputElem, text ):
+    async def typeKeys( self, inputElem, text ):
         """
         Simulate typing keys based on a user's typing speed / error rate
         """
@@ -630,7 +1353,7 @@ The most commonly used %(prog)s commands are:
                 # we're within an "appropriate" time frame, modify typing stats as if inebriated
                 drunk = True
 
-        self.user.typeKeys( self, inputElem, text, sloppy, drunk )
+        await self.user.typeKeys( self, inputElem, text, sloppy, drunk )
 
     # Logging Functions
     def logStats( self ):
@@ -644,6 +1367,10 @@ The most commonly used %(prog)s commands are:
         dblog.log( 'stat', 'Handled: %s [ %.2f url/hr ]' % ( self.stats[ 'handled' ], hrRate * self.stats[ 'handled' ] ) )
         dblog.log( 'stat', 'Visited: %s [ %.2f url/hr ]' % ( self.stats[ 'visited' ], hrRate * self.stats[ 'visited' ] ) )
         dblog.log( 'stat', 'Total:   %s [ %.2f url/hr ]' % ( total, hrRate * total ) )
+        dblog.log( 'stat', 'Browser restarts: %s' % self.stats[ 'restarts' ] )
+        dblog.log( 'stat', 'Failed restarts:  %s' % self.stats[ 'restartFailures' ] )
+        dblog.log( 'stat', 'Load timeouts:    %s' % self.stats[ 'timeouts' ] )
+        dblog.log( 'stat', 'Fetch errors:     %s' % self.stats[ 'fetchErrors' ] )
         dblog.log( 'stat', 'Elapsed: %s' % dur )
 
     # Debug Functions
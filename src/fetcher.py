@@ -0,0 +1,263 @@
+import gzip
+import zlib
+import logging
+import threading
+import html.parser
+import http.client
+import http.cookiejar
+import urllib.parse
+import urllib.request
+
+import dblog
+
+class resourceParser( html.parser.HTMLParser ):
+    """
+    Collects the urls of a page's images, scripts, stylesheets and icons
+    """
+    # tag -> ( url attribute, link rels that are fetched or None for any )
+    RESOURCE_TAGS = {
+        'img': ( 'src', None ),
+        'script': ( 'src', None ),
+        'link': ( 'href', { 'stylesheet', 'icon', 'shortcut' } )
+    }
+
+    def __init__( self ):
+        super( ).__init__( convert_charrefs = True )
+        self.urls = [ ]
+
+    def handle_starttag( self, tag, attrs ):
+        if tag not in self.RESOURCE_TAGS:
+            return
+
+        ( urlAttr, rels ) = self.RESOURCE_TAGS[ tag ]
+        attrs = dict( attrs )
+        if rels is not None and not rels.intersection( ( attrs.get( 'rel' ) or '' ).lower( ).split( ) ):
+            return
+        if attrs.get( urlAttr ):
+            self.urls.append( attrs[ urlAttr ] )
+
+class fetcher( object ):
+    """
+    Visits pages over plain HTTP(S) like a browser would, without running one: keep-alive connections
+    are pooled per host, cookies and headers are kept per persona, and a page's resources can be fetched too
+    """
+    # headers sent by each browser persona
+    USER_AGENTS = {
+        'firefox': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:115.0) Gecko/20100101 Firefox/115.0',
+        'chrome': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/115.0.0.0 Safari/537.36',
+        'ie': 'Mozilla/5.0 (Windows NT 10.0; WOW64; Trident/7.0; rv:11.0) like Gecko'
+    }
+    ACCEPT_PAGE = 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+    ACCEPT_RESOURCE = '*/*'
+    ACCEPT_LANGUAGE = 'en-US,en;q=0.5'
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+    # request limits
+    TIMEOUT_SEC = 30
+    MAX_REDIRECTS = 5
+    MAX_RESOURCES = 30
+    MAX_PAGE_BYTES = 5 * 1024 * 1024
+    READ_CHUNK_BYTES = 64 * 1024
+
+    # idle keep-alive connections kept per host, like a browser's per-host limit
+    MAX_IDLE_PER_HOST = 6
+
+    REDIRECT_STATUSES = { 301, 302, 303, 307, 308 }
+
+    def __init__( self, browserName = 'firefox', resources = True ):
+        self.userAgent = self.USER_AGENTS.get( browserName, self.USER_AGENTS[ 'firefox' ] )
+        self.resources = resources
+        self.cookies = http.cookiejar.CookieJar( )
+        self.pool = { }
+        self.poolLock = threading.Lock( )
+
+    def log( self, msg, level = logging.INFO ):
+        """
+        Shortcut to DB's logger
+        """
+        dblog.log( 'fetch', msg, level = level )
+
+    def fetch( self, url ):
+        """
+        Fetch a page, following redirects, then the resources it links to.
+        Returns the page's final status, or None if it couldn't be fetched
+        """
+        ( status, pageUrl, contentType, body ) = self.request( url, self.ACCEPT_PAGE, readLimit = self.MAX_PAGE_BYTES )
+        if status is None:
+            return None
+
+        fetched = 0
+        if self.resources and status == 200 and 'html' in contentType:
+            for resourceUrl in self.resourceUrls( pageUrl, contentType, body ):
+                self.request( resourceUrl, self.ACCEPT_RESOURCE, referer = pageUrl )
+                fetched += 1
+
+        self.log( '%d [ %s ] with %d resources' % ( status, pageUrl, fetched ), level = logging.DEBUG )
+
+        return status
+
+    def resourceUrls( self, pageUrl, contentType, body ):
+        """
+        Absolute http(s) urls of a page's resources, in page order without repeats
+        """
+        charset = 'utf-8'
+        for param in contentType.split( ';' )[ 1: ]:
+            ( key, _, value ) = param.strip( ).partition( '=' )
+            if key.lower( ) == 'charset' and value:
+                charset = value.strip( '"\'' )
+
+        try:
+            text = body.decode( charset, errors = 'replace' )
+        except LookupError:
+            text = body.decode( 'utf-8', errors = 'replace' )
+
+        parser = resourceParser( )
+        parser.feed( text )
+        parser.close( )
+
+        urls = [ ]
+        for resourceUrl in parser.urls:
+            resourceUrl = urllib.parse.urljoin( pageUrl, resourceUrl.strip( ) )
+            if resourceUrl.startswith( ( 'http://', 'https://' ) ) and resourceUrl not in urls:
+                urls.append( resourceUrl )
+
+        return urls[ :self.MAX_RESOURCES ]
+
+    def request( self, url, accept, referer = None, readLimit = 0 ):
+        """
+        GET a url, following redirects. Returns ( status, final url, content type, body ), the body is only read
+        up to readLimit bytes and decompressed, otherwise it is drained and discarded. Status is None on errors
+        """
+        for redirect in range( self.MAX_REDIRECTS + 1 ):
+            try:
+                ( response, body ) = self.send( url, accept, referer, readLimit )
+            except ( OSError, http.client.HTTPException, ValueError ) as e:
+                self.log( 'Unable to fetch [ %s ]: %s' % ( url, e ), level = logging.WARNING )
+                return None, url, '', b''
+
+            location = response.getheader( 'Location' )
+            if response.status not in self.REDIRECT_STATUSES or not location:
+                return response.status, url, response.getheader( 'Content-Type', '' ), body
+
+            url = urllib.parse.urljoin( url, location )
+
+        self.log( 'Too many redirects fetching [ %s ]' % url, level = logging.WARNING )
+        return None, url, '', b''
+
+    def send( self, url, accept, referer, readLimit ):
+        """
+        Send one GET on a pooled connection, retrying once on a fresh connection if a kept-alive one was closed
+        """
+        parts = urllib.parse.urlsplit( url )
+        if parts.scheme not in ( 'http', 'https' ) or not parts.hostname:
+            raise ValueError( 'not an http(s) url' )
+
+        key = ( parts.scheme, parts.hostname, parts.port )
+        path = urllib.parse.urlunsplit( ( '', '', parts.path or '/', parts.query, '' ) )
+        headers = self.headers( url, accept, referer )
+        for attempt in range( 2 ):
+            ( conn, reused ) = self.connection( key )
+            try:
+                conn.request( 'GET', path, headers = headers )
+                response = conn.getresponse( )
+                body = self.readBody( response, readLimit )
+            except ( http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError ):
+                conn.close( )
+                if reused and not attempt:
+                    continue
+                raise
+            except Exception:
+                conn.close( )
+                raise
+
+            self.cookies.extract_cookies( response, urllib.request.Request( url ) )
+            if response.will_close:
+                conn.close( )
+            else:
+                self.release( key, conn )
+
+            return response, body
+
+    def headers( self, url, accept, referer ):
+        """
+        The persona's request headers for a url, with its cookies
+        """
+        request = urllib.request.Request( url, headers = {
+            'User-Agent': self.userAgent,
+            'Accept': accept,
+            'Accept-Language': self.ACCEPT_LANGUAGE,
+            'Accept-Encoding': self.ACCEPT_ENCODING,
+            'Connection': 'keep-alive'
+        } )
+        if referer:
+            request.add_header( 'Referer', referer )
+        self.cookies.add_cookie_header( request )
+
+        return dict( request.header_items( ) )
+
+    def readBody( self, response, readLimit ):
+        """
+        Read a response so its connection can be reused, keeping and decompressing up to readLimit bytes
+        """
+        body = [ ]
+        kept = 0
+        while True:
+            chunk = response.read( self.READ_CHUNK_BYTES )
+            if not chunk:
+                break
+            if kept < readLimit:
+                body.append( chunk )
+                kept += len( chunk )
+
+        body = b''.join( body )
+        if not body:
+            return body
+
+        encoding = ( response.getheader( 'Content-Encoding' ) or '' ).lower( )
+        try:
+            if encoding == 'gzip':
+                body = gzip.decompress( body )
+            elif encoding == 'deflate':
+                body = zlib.decompress( body )
+        except ( OSError, EOFError, zlib.error ):
+            # a body cut off at readLimit can't be fully decompressed, its resources just aren't fetched
+            body = b''
+
+        return body
+
+    def connection( self, key ):
+        """
+        Returns an idle pooled connection to a ( scheme, host, port ), or a new one, and whether it was reused
+        """
+        with self.poolLock:
+            idle = self.pool.get( key )
+            if idle:
+                return idle.pop( ), True
+
+        ( scheme, host, port ) = key
+        connClass = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+
+        return connClass( host, port, timeout = self.TIMEOUT_SEC ), False
+
+    def release( self, key, conn ):
+        """
+        Return a connection to the pool, closing it if the host already has enough idle connections
+        """
+        with self.poolLock:
+            idle = self.pool.setdefault( key, [ ] )
+            if len( idle ) < self.MAX_IDLE_PER_HOST:
+                idle.append( conn )
+                return
+
+        conn.close( )
+
+    def close( self ):
+        """
+        Close all pooled connections
+        """
+        with self.poolLock:
+            for idle in self.pool.values( ):
+                for conn in idle:
+                    conn.close( )
+            self.pool = { }
@@ -12,22 +12,22 @@ def log( text ):
     """
     dblog.log( 'handlers', text )
 
-def skipUrl( db, url, matches ):
+async def skipUrl( db, url, matches ):
     """
     Does nothing - handler to literally do nothing at all
     """
     pass
 
-def watchYoutube( db, url, matches ):
+def openYoutube( db, url ):
     """
-    Visits a YouTube video and pauses for the duration of the video
+    Visits a YouTube video, returns its title and duration in seconds, None if it has no duration
     """
     db.visitUrl( url )
     # duration may not exist if the Youtube video has been taken down
     try:
         durStr = db.browser( ).find_element_by_xpath( "//meta[@itemprop='duration']" ).get_attribute( "content" )
     except NoSuchElementException:
-        return
+        return None
 
     # https://stackoverflow.com/questions/16742381/how-to-convert-youtube-api-duration-to-seconds
     ISO_8601_period_rx = re.compile(
@@ -49,11 +49,29 @@ def watchYoutube( db, url, matches ):
              + 60 * 60 * int( dur[ 'hours' ] or 0 )
 
     title = db.browser().find_element_by_id('eow-title').get_attribute( "title" )
+    return ( title, durSec )
+
+async def watchYoutube( db, url, matches ):
+    """
+    Visits a YouTube video and pauses for the duration of the video
+    """
+    video = await db.call( openYoutube, db, url )
+    if not video:
+        return
+
+    ( title, durSec ) = video
     log( 'Watching [ %s ] for %s seconds' % ( title, durSec ) )
-    db.user.idle( durSec )
+    await db.user.idle( durSec )
     log( 'Finished watching youtube' )
 
-def searchGoogle( db, url, matches ):
+def openSearch( db, url ):
+    """
+    Visits a search engine, returns its search box
+    """
+    db.visitUrl( url )
+    return db.browser( ).find_element_by_name( 'q' )
+
+async def searchGoogle( db, url, matches ):
     """
     Visits Google and searches manually via typeKeys
     """
@@ -62,28 +80,27 @@ def searchGoogle( db, url, matches ):
     # remove extra query string params from regex match
     searchTerm = searchTerm.split( '&' )[ 0 ]
     log( 'Searching Google for [ %s ]' % searchTerm )
-    db.user.react( )
-    db.visitUrl( 'https://google.com/' )
-    elem = db.browser( ).find_element_by_name( 'q' )
-    db.typeKeys( elem, searchTerm )
-    elem.send_keys( Keys.RETURN )
-    db.user.pause( )
+    await db.user.react( )
+    elem = await db.call( openSearch, db, 'https://google.com/' )
+    await db.typeKeys( elem, searchTerm )
+    await db.call( elem.send_keys, Keys.RETURN )
+    await db.user.pause( )
 
-def searchDuckDuckGo( db, url, matches ):
+async def searchDuckDuckGo( db, url, matches ):
     """
     Visits DuckDuckGo and searches manually via typeKeys
     """
     # search DDG "manually"
     searchTerm = urllib.parse.unquote_plus( matches[ 0 ] )
     log( 'Searching DuckDuckGo for [ %s ]' % searchTerm )
-    db.user.react( )
-    db.visitUrl( 'https://duckduckgo.com/' )
-    elem = db.browser( ).find_element_by_name( 'q' )
-    db.typeKeys( elem, searchTerm )
-    elem.send_keys( Keys.RETURN )
-    db.user.pause( )
+    await db.user.react( )
+    elem = await db.call( openSearch, db, 'https://duckduckgo.com/' )
+    await db.typeKeys( elem, searchTerm )
+    await db.call( elem.send_keys, Keys.RETURN )
+    await db.user.pause( )
 
-# handlers array containing regex-rules -> handler associations
+# handlers array containing regex-rules -> handler associations,
+# handlers are coroutines that make their blocking browser calls through db.call
 handlers = [
     # skip media
     ( r'(.*).(mp3|mp4|mkv|jpg|png|jpeg|gif)', skipUrl ),
@@ -94,4 +111,11 @@ handlers = [
     ( r'duckduckgo.com/\?q=(\w+.*)', searchDuckDuckGo ),
     ( r'duckduckgo.com/html/\?q=(\w+.*)', searchDuckDuckGo ),
     ( r'google.com/search\?q=(\w+.*)', searchGoogle )
-]
\ No newline at end of file
+]
+
+# page load deadlines (in seconds) for visits made by a handler, other visits use the default deadline
+deadlines = {
+    watchYoutube: 20,
+    searchGoogle: 10,
+    searchDuckDuckGo: 10
+}
\ No newline at end of file
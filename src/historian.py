@@ -1,9 +1,18 @@
+import math
+import json
+import heapq
+import bisect
 import random
+import sqlite3
+import itertools
+import threading
+import concurrent.futures
 from datetime import *
-import dateutil.parser
 
 import logging
 import dblog
+import datamgr
+import seedengine
 
 class historian( ):
     """
@@ -16,15 +25,135 @@ class historian( ):
     HHR_FACTOR = 1.25
 
     # select all url-instances since a specified time
-    SQL_SELECT_URL_HISTORY = 'SELECT timestamp, url, guid FROM history WHERE timestamp > ? ORDER BY timestamp ASC'
+    SQL_SELECT_URL_HISTORY = '''
+        SELECT H.timestamp, U.url, H.guid
+        FROM history H JOIN urls U ON ( U.id = H.url_id )
+        WHERE H.timestamp > ?
+        ORDER BY H.timestamp ASC
+        '''
 
     # select all url-instances since a specified time and matching a specified pattern
-    SQL_SELECT_URL_HISTORY_PATTERN = 'SELECT timestamp, url, guid FROM history WHERE url like ? AND timestamp > ? ORDER BY timestamp ASC'
-
-    def __init__( self, db ):
+    SQL_SELECT_URL_HISTORY_PATTERN = '''
+        SELECT H.timestamp, U.url, H.guid
+        FROM history H JOIN urls U ON ( U.id = H.url_id )
+        WHERE U.url like ? AND H.timestamp > ?
+        ORDER BY H.timestamp ASC
+        '''
+
+    # select url-instances in a time range matching a pattern, in time order from the history_timestamp index
+    SQL_SELECT_URL_HISTORY_RANGE = '''
+        SELECT H.timestamp, U.url, H.guid
+        FROM history H JOIN urls U ON ( U.id = H.url_id )
+        WHERE H.timestamp >= ? AND H.timestamp < ? AND U.url like ?
+        ORDER BY H.timestamp ASC
+        '''
+
+    # select the urls a url led to on the same host, with how often, from the transition index
+    SQL_SELECT_NEXT_URLS = '''
+        SELECT T.url, X.weight
+        FROM urls F
+        JOIN transitions X ON ( X.from_id = F.id )
+        JOIN urls T ON ( T.id = X.to_id )
+        WHERE F.url = ? AND T.host = F.host AND T.id != F.id
+        '''
+
+    # select the most visited urls for a day of week from the seed rollup, -1 = every half-hour block
+    SQL_SELECT_DOW_URL_DATA = '''
+        SELECT  U.url,
+                R.url_id,
+                R.visit_count,
+                R.day_count,
+                R.visit_count AS guidCount
+        FROM    seed_rollup R
+        JOIN    urls U ON ( U.id = R.url_id )
+        WHERE   R.day_of_week = ? AND R.half_hour = -1
+        ORDER BY R.visit_count DESC
+        LIMIT   ?
+        '''
+
+    # select the most visited urls for a half-hour block from the seed rollup, -1 = every day of week
+    SQL_SELECT_HALF_HOUR_URL_DATA = '''
+        SELECT  U.url,
+                R.url_id,
+                R.visit_count,
+                R.day_count,
+                R.visit_count AS guidCount
+        FROM    seed_rollup R
+        JOIN    urls U ON ( U.id = R.url_id )
+        WHERE   R.day_of_week = -1 AND R.half_hour = ?
+        ORDER BY R.visit_count DESC
+        LIMIT   ?
+        '''
+
+    # select total visits and distinct days for a seed rollup bucket
+    SQL_SELECT_BUCKET_TOTALS = 'SELECT visit_count, day_count FROM seed_rollup_totals WHERE day_of_week = ? AND half_hour = ?'
+
+    # select the most visited urls of every half-hour block from the seed rollup in one pass, -1 = every day of week
+    SQL_SELECT_HALF_HOURS_URL_DATA = '''
+        SELECT  half_hour, url, url_id, visit_count, day_count, guidCount
+        FROM (
+            SELECT  R.half_hour,
+                    U.url,
+                    R.url_id,
+                    R.visit_count,
+                    R.day_count,
+                    R.visit_count AS guidCount,
+                    ROW_NUMBER( ) OVER ( PARTITION BY R.half_hour ORDER BY R.visit_count DESC, R.url_id DESC ) AS rank
+            FROM    seed_rollup R
+            JOIN    urls U ON ( U.id = R.url_id )
+            WHERE   R.day_of_week = -1 AND R.half_hour >= 0
+        )
+        WHERE   rank <= ?
+        ORDER BY half_hour, rank
+        '''
+
+    # select the totals of a day of week and of every half-hour block
+    SQL_SELECT_DAY_TOTALS = '''
+        SELECT day_of_week, half_hour, visit_count, day_count
+        FROM seed_rollup_totals
+        WHERE ( day_of_week = ? AND half_hour = -1 ) OR ( day_of_week = -1 AND half_hour >= 0 )
+        '''
+
+    # max day-of-week / half-hour slots kept in the seed cache, least recently used are evicted
+    SEED_CACHE_SLOTS = 64
+
+    # select / touch a cached seed slot
+    SQL_SELECT_SEED_CACHE = '''
+        SELECT daily_rows, half_hour_rows, daily_rate, half_hour_rate
+        FROM seed_cache
+        WHERE day_of_week = ? AND half_hour = ?
+        '''
+    SQL_TOUCH_SEED_CACHE = 'UPDATE seed_cache SET used_at = ? WHERE day_of_week = ? AND half_hour = ?'
+
+    # cache a seed slot, then evict all but the most recently used slots
+    SQL_INSERT_SEED_CACHE = '''
+        INSERT OR REPLACE INTO seed_cache (day_of_week,half_hour,daily_rows,half_hour_rows,daily_rate,half_hour_rate,used_at)
+        VALUES (?,?,?,?,?,?,?)
+        '''
+    SQL_EVICT_SEED_CACHE = '''
+        DELETE FROM seed_cache WHERE rowid NOT IN (
+            SELECT rowid FROM seed_cache ORDER BY used_at DESC LIMIT ?
+        )
+        '''
+
+    # seed engines, auto uses numpy when it is installed
+    SEED_ENGINES = [ 'auto', 'numpy', 'sql' ]
+
+    def __init__( self, db, rng = None, dataMgr = None ):
         self.db = db
+        self.engine = None
+        self.rng = rng or random.Random( )
+        self._dataMgr = dataMgr
+        self.prefetcher = None
+        self.prefetchLocal = threading.local( )
 
     # shortcut / helper functions
+    def dataMgr( self ):
+        """
+        Data manager used for queries, the DB's unless this historian has its own connection
+        """
+        return self._dataMgr or self.db.dataMgr
+
     def log( self, msg, level = logging.INFO ):
         """
         Shortcut to DB's logger
@@ -35,13 +164,19 @@ class historian( ):
         """
         Shortcut to SQL functions
         """
-        self.db.dataMgr.executeSql( sql, args )
+        self.dataMgr( ).executeSql( sql, args )
 
     def sqlResults( self ):
         """
         Shortcut to SQL functions
         """
-        return self.db.dataMgr.curs( ).fetchall( )
+        return self.dataMgr( ).curs( ).fetchall( )
+
+    def commit( self ):
+        """
+        Shortcut to SQL functions
+        """
+        self.dataMgr( ).conn( ).commit( )
 
     def getUrlHistory( self, days, urlPattern = '' ):
         """
@@ -65,75 +200,115 @@ class historian( ):
 
         return histRows
 
+    def loadSeedEngine( self, engineName ):
+        """
+        Load seed data into memory when using the numpy engine,
+        otherwise seed data is queried from the seed rollups as needed
+        """
+        self.engine = None
+        if engineName == 'sql' or ( engineName == 'auto' and not seedengine.seedengine.available( ) ):
+            self.log( 'Using seed rollups for seed data' )
+            return
+
+        if not seedengine.seedengine.available( ):
+            self.log( 'numpy is not installed, using seed rollups for seed data', logging.WARNING )
+            return
+
+        self.log( 'Loading history into the numpy seed engine' )
+        self.engine = seedengine.seedengine( self.MAX_SEED_RESULTS )
+        self.engine.load( self.dataMgr( ) )
+
+    def iterUrlHistory( self, since, until, urlPattern = '' ):
+        """
+        Generator of url-instances from since up to until, optionally matching a pattern, in time order.
+        Rows are streamed in batches on a dedicated cursor, so memory use doesn't grow with the range
+        """
+        curs = self.dataMgr( ).conn( ).cursor( )
+        self.dataMgr( ).executeSql( self.SQL_SELECT_URL_HISTORY_RANGE, ( since, until, urlPattern or '%' ), curs )
+        try:
+            while True:
+                rows = curs.fetchmany( datamgr.datamgr.IMPORT_BATCH_SIZE )
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            curs.close( )
+
+    def getNextUrl( self, url ):
+        """
+        Pick the next page of a click chain from url, weighted by how often each of the same site's
+        urls followed it, or None if url never led anywhere on its site
+        """
+        self.executeSql( self.SQL_SELECT_NEXT_URLS, ( url, ) )
+        nextRow = self.weightedUrlChoice( self.sqlResults( ), 'weight' )
+
+        return nextRow[ 'url' ] if nextRow else None
+
     def getDoWUrlData( self, dayOfWeek ):
+        """
+        Fetches the most visited urls for a day of week (0-6 from Sunday)
+        """
         self.log( 'Fetching day[%d] results' % dayOfWeek, level = logging.DEBUG )
+        if self.engine:
+            return self.engine.getDoWUrlData( dayOfWeek )
 
-        sql = '''
-            SELECT  *,
-                    date( timestamp) as dayBucket,
-                    strftime("%s",timestamp) as dateStr,
-                    count( guid ) as guidCount
-            FROM    history H
-            WHERE   dateStr == ?
-            GROUP BY dateStr, dayBucket, url
-            ORDER BY guidCount DESC
-            LIMIT   %d
-        ''' % ( '%w', self.MAX_SEED_RESULTS )
-        self.executeSql( sql, (str( dayOfWeek ),) )
+        self.executeSql( self.SQL_SELECT_DOW_URL_DATA, ( dayOfWeek, self.MAX_SEED_RESULTS ) )
 
         return self.sqlResults( )
 
     def getHalfHrlyUrlData( self, hour, minBlock ):
-        fmt = '%02d:%02d'
-        self.log( 'Fetching .5-hr[%s] results' % ( fmt % ( hour, minBlock ) ), level = logging.DEBUG )
-        minTime = fmt % ( hour, minBlock )
-        maxTime = fmt % ( hour, 30 ) if not minBlock else fmt % ( ((hour + 1) % 24), 0 )
-        sql = '''
-            SELECT  *,
-                    date(timestamp) as dayBucket,
-                    strftime("%s",timestamp) as timeBucket,
-                    count(guid) as guidCount
-            FROM    history H
-            WHERE   ( timeBucket >= ? ) AND ( timeBucket <= ? )
-            GROUP BY dayBucket, timeBucket, url
-            ORDER BY guidCount DESC
-            LIMIT   %d
-        ''' % ( '%H:%m', self.MAX_SEED_RESULTS )
-        self.executeSql( sql, (minTime, maxTime) )
+        """
+        Fetches the most visited urls for the half-hour block starting at hour:minBlock
+        """
+        self.log( 'Fetching .5-hr[%02d:%02d] results' % ( hour, minBlock ), level = logging.DEBUG )
+        halfHour = self.halfHourBlock( hour, minBlock )
+        if self.engine:
+            return self.engine.getHalfHrlyUrlData( halfHour )
+
+        self.executeSql( self.SQL_SELECT_HALF_HOUR_URL_DATA, ( halfHour, self.MAX_SEED_RESULTS ) )
 
         return self.sqlResults( )
 
-    def getSeedUrlData( self, seedDtm = datetime.now( ) ):
+    def halfHourBlock( self, hour, minute ):
+        """
+        Returns the 0-47 half-hour block of the day containing hour:minute
+        """
+        return ( 2 * hour ) + ( minute // 30 )
+
+    def getSeedUrlData( self, seedDtm = None ):
         """
         Examines urls in the past that match time / day of week / etc. today
         """
+        seedDtm = seedDtm or datetime.now( )
         self.log( 'Generating Seed URLs for [ %s ]' % seedDtm )
-        level = logging.INFO
         # use current 30-min period and day of week to build 'seed' data set
         # every 30-min of browsing we can reseed the data set, so we'll be working
         # with time-relevant data but smaller memory footprint and smaller DB hits
-        day = seedDtm.weekday( )
+        # history buckets days of week from Sunday = 0
+        day = seedDtm.isoweekday( ) % 7
         hour = seedDtm.hour
 
-        # get the daily results
-        self.log( 'Fetching day-of-week results [%d]' % day, level = level )
-        dailyRows = self.getDoWUrlData( day )
+        minBlock = 30 * ( seedDtm.minute // 30 )
 
-        # and now the half-hourly
-        minBlock = 30 * round( seedDtm.minute / 60, 0 )
-        self.log( 'Fetching 1/2-hourly results [%02d:%02d]' % ( hour, minBlock ), level )
-        halfHourlyRows = self.getHalfHrlyUrlData( hour, minBlock )
+        # candidate urls and rates of this day / 30-min slot, only sampling happens per refresh
+        return self.sampleSeedSlot( seedDtm, self.getSeedSlot( day, hour, minBlock ) )
+
+    def sampleSeedSlot( self, seedDtm, slot ):
+        """
+        Samples the seed urls and browsing rate for seedDtm from its seed slot, without querying
+        """
+        level = logging.INFO
+        ( dailyRows, halfHourlyRows, dailyRate, perHalfHourRate ) = slot
+        day = seedDtm.isoweekday( ) % 7
+        hour = seedDtm.hour
+        minBlock = 30 * ( seedDtm.minute // 30 )
 
         # merge them together
         merged = self.mergeSeedUrlSegments( dailyRows, halfHourlyRows )
 
-        # do some stats in 30-min blocks
-        dailyRate = self.getUrlRate( 48, dailyRows )
-        perHalfHourRate = self.getUrlRate( 48, halfHourlyRows )
-
         # average between the two rates, then give a 25% fuzz factor
         mergedRate  = 0.5 * ( ( self.DAY_FACTOR * dailyRate ) + ( self.HHR_FACTOR * perHalfHourRate ) )
-        fuzzFactor  = random.choice([-1,1]) * ( random.uniform( 0, mergedRate ) / 8 )
+        fuzzFactor  = self.rng.choice([-1,1]) * ( self.rng.uniform( 0, mergedRate ) / 8 )
         mergedRate += fuzzFactor
 
         # log it all as debug, essentials as info, and return a tuple of the merged list and visit-rate
@@ -145,24 +320,173 @@ class historian( ):
 
         return list( merged ), mergedRate
 
-    def getUrlRate( self, duration, urlRows = [ ], rateKey = 'visit_count' ):
+    def startPrefetch( self, location ):
+        """
+        Start a worker thread, with its own connection to the history database at location,
+        that computes upcoming seed data ahead of time
+        """
+        self.prefetchLocation = location
+        self.prefetcher = concurrent.futures.ThreadPoolExecutor( max_workers = 1, thread_name_prefix = 'seed-prefetch' )
+
+    def stopPrefetch( self ):
+        """
+        Wait for any running prefetch and close the worker's connection
+        """
+        if self.prefetcher:
+            self.prefetcher.submit( self.closePrefetchWorker )
+            self.prefetcher.shutdown( wait = True )
+            self.prefetcher = None
+
+    def prefetchSeedUrlData( self, seedDtm ):
         """
-        For a list of URLs, determine the about how many URLs per time period are visited
+        Compute getSeedUrlData( seedDtm ) on the prefetch thread, returns a future of its result
         """
-        if len( urlRows ) == 0:
+        return self.prefetcher.submit( self.prefetchWorker, seedDtm )
+
+    def prefetchWorker( self, seedDtm ):
+        """
+        Prefetch thread: compute seed data with a historian bound to the thread's own connection
+        """
+        local = self.prefetchLocal
+        if not hasattr( local, 'historian' ):
+            dataMgr = datamgr.datamgr( self.db )
+            dataMgr.openDb( self.prefetchLocation )
+            local.historian = historian( self.db, random.Random( self.rng.random( ) ), dataMgr )
+
+        # the numpy seed engine is read-only once loaded and shared with the worker
+        local.historian.engine = self.engine
+        return local.historian.getSeedUrlData( seedDtm )
+
+    def closePrefetchWorker( self ):
+        """
+        Prefetch thread: close the thread's connection
+        """
+        if hasattr( self.prefetchLocal, 'historian' ):
+            self.prefetchLocal.historian.dataMgr( ).closeConn( )
+            del self.prefetchLocal.historian
+
+    def getSeedSlot( self, day, hour, minBlock ):
+        """
+        Returns the day-of-week / half-hourly candidate urls and rates for a seed slot, from the seed cache
+        when possible. The numpy seed engine is already in memory and skips the cache
+        """
+        level = logging.INFO
+        halfHour = self.halfHourBlock( hour, minBlock )
+        if not self.engine:
+            slot = self.getCachedSeedSlot( day, halfHour )
+            if slot:
+                self.log( 'Using cached seed data [%d %02d:%02d]' % ( day, hour, minBlock ), level )
+                return slot
+
+        # get the daily results
+        self.log( 'Fetching day-of-week results [%d]' % day, level = level )
+        dailyRows = [ dict( row ) for row in self.getDoWUrlData( day ) ]
+
+        # and now the half-hourly
+        self.log( 'Fetching 1/2-hourly results [%02d:%02d]' % ( hour, minBlock ), level )
+        halfHourlyRows = [ dict( row ) for row in self.getHalfHrlyUrlData( hour, minBlock ) ]
+
+        # do some stats in 30-min blocks
+        anyBucket = datamgr.datamgr.SEED_ROLLUP_ANY
+        dailyRate = self.getBucketRate( 48, day, anyBucket )
+        perHalfHourRate = self.getBucketRate( 1, anyBucket, halfHour )
+
+        slot = ( dailyRows, halfHourlyRows, dailyRate, perHalfHourRate )
+        if not self.engine:
+            self.cacheSeedSlot( day, halfHour, slot )
+
+        return slot
+
+    def getSeedDaySlots( self, day ):
+        """
+        Returns the seed slots of all 48 half-hour blocks of a day of week, loaded in one pass
+        rather than a query per block. Used to plan whole days, skips the seed cache
+        """
+        self.log( 'Fetching seed data of day [%d]' % day )
+        anyBucket = datamgr.datamgr.SEED_ROLLUP_ANY
+        blocks = range( 48 )
+        dailyRows = [ dict( row ) for row in self.getDoWUrlData( day ) ]
+        if self.engine:
+            return [ ( dailyRows, self.engine.getHalfHrlyUrlData( halfHour ),
+                       self.engine.getBucketRate( 48, day, anyBucket ),
+                       self.engine.getBucketRate( 1, anyBucket, halfHour ) ) for halfHour in blocks ]
+
+        halfHourlyRows = { halfHour: [ ] for halfHour in blocks }
+        self.executeSql( self.SQL_SELECT_HALF_HOURS_URL_DATA, ( self.MAX_SEED_RESULTS, ) )
+        for row in self.sqlResults( ):
+            row = dict( row )
+            halfHourlyRows[ row.pop( 'half_hour' ) ].append( row )
+
+        dailyRate = 0
+        perHalfHourRates = { halfHour: 0 for halfHour in blocks }
+        self.executeSql( self.SQL_SELECT_DAY_TOTALS, ( day, ) )
+        for totals in self.sqlResults( ):
+            if totals[ 'half_hour' ] == anyBucket:
+                dailyRate = self.totalsRate( 48, totals )
+            else:
+                perHalfHourRates[ totals[ 'half_hour' ] ] = self.totalsRate( 1, totals )
+
+        return [ ( dailyRows, halfHourlyRows[ halfHour ], dailyRate, perHalfHourRates[ halfHour ] )
+                 for halfHour in blocks ]
+
+    def getCachedSeedSlot( self, day, halfHour ):
+        """
+        Returns a cached ( daily rows, half-hourly rows, daily rate, half-hourly rate ) seed slot, or None
+        """
+        try:
+            self.executeSql( self.SQL_SELECT_SEED_CACHE, ( day, halfHour ) )
+            cached = self.sqlResults( )
+            if not cached:
+                return None
+
+            self.executeSql( self.SQL_TOUCH_SEED_CACHE, ( datetime.now( ).timestamp( ), day, halfHour ) )
+            self.commit( )
+        except sqlite3.OperationalError as e:
+            self.log( 'Unable to read the seed cache (%s)' % e, logging.WARNING )
+            return None
+
+        row = cached[ 0 ]
+        return ( json.loads( row[ 'daily_rows' ] ), json.loads( row[ 'half_hour_rows' ] ),
+                 row[ 'daily_rate' ], row[ 'half_hour_rate' ] )
+
+    def cacheSeedSlot( self, day, halfHour, slot ):
+        """
+        Store a seed slot in the seed cache, evicting the least recently used slots past SEED_CACHE_SLOTS
+        """
+        ( dailyRows, halfHourlyRows, dailyRate, perHalfHourRate ) = slot
+        try:
+            self.executeSql( self.SQL_INSERT_SEED_CACHE, ( day, halfHour, json.dumps( dailyRows ),
+                                                           json.dumps( halfHourlyRows ), dailyRate, perHalfHourRate,
+                                                           datetime.now( ).timestamp( ) ) )
+            self.executeSql( self.SQL_EVICT_SEED_CACHE, ( self.SEED_CACHE_SLOTS, ) )
+            self.commit( )
+        except sqlite3.OperationalError as e:
+            self.log( 'Unable to write the seed cache (%s)' % e, logging.WARNING )
+            self.dataMgr( ).conn( ).rollback( )
+
+    def getBucketRate( self, duration, dayOfWeek, halfHour ):
+        """
+        For a seed rollup bucket, determine about how many URLs per time period are visited
+        on the days that had any visits in that bucket
+        """
+        if self.engine:
+            return self.engine.getBucketRate( duration, dayOfWeek, halfHour )
+
+        self.executeSql( self.SQL_SELECT_BUCKET_TOTALS, ( dayOfWeek, halfHour ) )
+        totals = self.sqlResults( )
+        if not totals:
             return 0
 
-        # sum for daily rate / quota
-        # start with daily groupings and then use duration to adjust daily/30min
-        uniqueDays = list( )
-        total = 0
-        for urlRow in urlRows:
-            total += urlRow[ rateKey ]
-            dateStr = dateutil.parser.parse( str( urlRow[ 'timestamp' ] ) ).date( ).isoformat( )
-            if dateStr not in uniqueDays:
-                uniqueDays.append( dateStr )
+        return self.totalsRate( duration, totals[ 0 ] )
+
+    def totalsRate( self, duration, totals ):
+        """
+        URLs per time period of a seed_rollup_totals row
+        """
+        if not totals[ 'day_count' ]:
+            return 0
 
-        avgDaily = total / len( uniqueDays )
+        avgDaily = totals[ 'visit_count' ] / totals[ 'day_count' ]
 
         return round( avgDaily / duration, 2 )
 
@@ -174,7 +498,6 @@ class historian( ):
         # get 25 unique choices, picked randomly w/ weights
         dayChoices = self.getNRandWeightedChoices( daily, self.SUB_SEED_RESULTS, weightKey = 'guidCount' )
 
-        print( 'hi %d' % len ( dayChoices ) )
         # get 25 unique choices, picked randomly w/ weights
         hrChoices = self.getNRandWeightedChoices( halfHourly, self.SUB_SEED_RESULTS, weightKey = 'guidCount' )
         # merge the 2 arrays together with their visit-weights multiplied by the bucket-factors
@@ -182,57 +505,53 @@ class historian( ):
         for dc in dayChoices:
             url = dc[ 'url' ]
             if url not in choices:
-                choices[ url ] = dict( zip( dc.keys( ), dc ) )
+                choices[ url ] = dict( dc )
                 choices[ url ][ 'count' ] = 0
             choices[ url ][ 'count' ] += self.DAY_FACTOR * dc[ 'guidCount' ]
 
-        print( 'hi %d' % len ( hrChoices ) )
         for hc in hrChoices:
             url = hc[ 'url' ]
             if url not in choices:
-                choices[ url ] = dict( zip( hc.keys( ), hc ) )
+                choices[ url ] = dict( hc )
                 choices[ url ][ 'count' ] = 0
             choices[ url ][ 'count' ] += self.HHR_FACTOR * hc[ 'guidCount' ]
 
         # now merged and weighted appropriately, pick a subset
         return self.getNRandWeightedChoices( choices.values( ), self.SUB_SEED_RESULTS, weightKey = 'count' )
 
-    def getNRandWeightedChoices( self, urlRows, numChoices, weightKey = 'visit_count', uniqueKey = 'url' ):
-        """
-        Get N random choices among weighted-values, no duplicates will be returned
-        """
-        if not len( urlRows ):
-            return { }.values( )
-
-        usedChoices = { }
-        numChoices  = min( len( urlRows ), numChoices )
-        for i in range( numChoices ):
-            urlValid = False
-            j = 0
-            while not urlValid:
-                choice = self.weightedUrlChoice( urlRows, weightKey )
-                j += 1
-                if j == numChoices:
-                    urlValid = True
-
-                if choice[ uniqueKey ] not in usedChoices:
-                    urlValid = True
-                    usedChoices[ choice[ uniqueKey ] ] = choice
-
-        return usedChoices.values( )
-
-    def weightedUrlChoice( self, urlRows, key = 'visit_count' ):
-        """
-        Return a random choice from the urlRows based on a weighted key-value
-        """
-        # sum the key, pick a random uniform point from 0-total
-        random.seed( )
-        total = sum( ur[ key ] for ur in urlRows )
-        randV = random.uniform( 0, total )
-        count = 0
-        for ur in urlRows:
-            if count + ur[ key ] > randV:
-                return ur
-            count += ur[ key ]
-        print( 'returning none %d' % len( urlRows ) )
-        return None
\ No newline at end of file
+    def getNRandWeightedChoices( self, urlRows, numChoices, weightKey = 'visit_count', uniqueKey = 'url', rng = None ):
+        """
+        Get N random choices among weighted-values, no duplicates will be returned.
+        Weighted sampling without replacement by Efraimidis-Spirakis keys: every row gets the key
+        log( u ) / weight for a uniform u in (0, 1] and the N largest keys are chosen, O(n log N)
+        """
+        rng = rng or self.rng
+        best = { }
+        for row in urlRows:
+            if row is None or row[ weightKey ] <= 0:
+                continue
+
+            key = math.log( 1.0 - rng.random( ) ) / row[ weightKey ]
+            unique = row[ uniqueKey ]
+            if unique not in best or key > best[ unique ][ 0 ]:
+                best[ unique ] = ( key, row )
+
+        chosen = heapq.nlargest( numChoices, best.values( ), key = lambda keyRow: keyRow[ 0 ] )
+
+        return [ row for ( key, row ) in chosen ]
+
+    def weightedUrlChoice( self, urlRows, key = 'visit_count', rng = None ):
+        """
+        Return a random choice from the urlRows based on a weighted key-value,
+        or None if no row has a positive weight
+        """
+        rng = rng or self.rng
+        urlRows = [ ur for ur in urlRows if ur is not None and ur[ key ] > 0 ]
+        if not urlRows:
+            return None
+
+        # pick a uniform point below the total and bisect the running sums for its row
+        cumWeights = list( itertools.accumulate( ur[ key ] for ur in urlRows ) )
+        randV = rng.random( ) * cumWeights[ -1 ]
+
+        return urlRows[ min( bisect.bisect_right( cumWeights, randV ), len( urlRows ) - 1 ) ]
@@ -0,0 +1,160 @@
+import re
+import csv
+import time
+import heapq
+import random
+import logging
+from datetime import datetime, timedelta
+
+import dblog
+
+class planner( object ):
+    """
+    Compiles whole days of browsing into a timeline of ( timestamp, url, handler ) visit events,
+    and runs a timeline in time order against absolute deadlines
+    """
+    # plan file columns, timestamps are ISO local times
+    PLAN_COLUMNS = [ 'timestamp', 'url', 'handler' ]
+
+    # length of a seed window / half-hour block
+    BLOCK_SEC = 1800
+
+    # seconds an event may start late before it is moved to a new time within its half-hour block
+    LATE_GRACE_SEC = 60
+
+    # times a block's seed urls are resampled when the block outlasts them
+    MAX_BLOCK_RESEEDS = 4
+
+    def __init__( self, historian, handlers = [ ], rng = None ):
+        self.historian = historian
+        self.handlers = [ ( re.compile( pattern ), handleFunc.__name__ ) for ( pattern, handleFunc ) in handlers ]
+        self.rng = rng or random.Random( )
+        self.events = [ ]
+        self.seq = 0
+
+    def log( self, msg, level = logging.INFO ):
+        """
+        Shortcut to DB's logger
+        """
+        dblog.log( 'plan', msg, level = level )
+
+    def handlerName( self, url ):
+        """
+        Name of the handler a url would be dispatched to, '' if it would just be visited
+        """
+        for ( pattern, name ) in self.handlers:
+            if pattern.search( url ):
+                return name
+
+        return ''
+
+    def blockStart( self, ts ):
+        """
+        Unix time of the local half-hour block containing unix time ts
+        """
+        dtm = datetime.fromtimestamp( ts )
+        return dtm.replace( minute = 30 * ( dtm.minute // 30 ), second = 0, microsecond = 0 ).timestamp( )
+
+    def addEvent( self, ts, url, handler ):
+        """
+        Push a visit event at unix time ts onto the timeline
+        """
+        heapq.heappush( self.events, ( ts, self.seq, url, handler ) )
+        self.seq += 1
+
+    def compile( self, startDate, days = 1 ):
+        """
+        Plan every half-hour block of days starting at startDate, from the historian's seed data
+        """
+        tick = time.time( )
+        for day in range( days ):
+            dayStart = datetime.combine( startDate + timedelta( days = day ), datetime.min.time( ) )
+            # the day's rollups are loaded once and sliced per block, history buckets days from Sunday = 0
+            slots = self.historian.getSeedDaySlots( dayStart.isoweekday( ) % 7 )
+            for block in range( 24 * 60 * 60 // self.BLOCK_SEC ):
+                self.compileBlock( dayStart + timedelta( seconds = block * self.BLOCK_SEC ), slots[ block ] )
+
+        self.log( 'Planned %d visits over %d day(s) from %s in %.2fs' % ( len( self.events ), days, startDate,
+                                                                         time.time( ) - tick ) )
+
+    def compileBlock( self, blockStart, slot ):
+        """
+        Plan a half-hour block from its seed slot, visits are spaced like simulateRealtime: 30 min / rate, +/- 25%
+        """
+        ( urlRows, ratePerHalfHour ) = self.historian.sampleSeedSlot( blockStart, slot )
+        if not urlRows or ratePerHalfHour <= 0:
+            return
+
+        secPerUrl = self.BLOCK_SEC / ratePerHalfHour
+        ts = blockStart.timestamp( ) + self.rng.uniform( 0, secPerUrl )
+        blockEnd = blockStart.timestamp( ) + self.BLOCK_SEC
+        reseeds = 0
+        while ts < blockEnd:
+            # the block outlasted its seed urls, resample them like simulateRealtime does
+            if not urlRows:
+                reseeds += 1
+                if reseeds > self.MAX_BLOCK_RESEEDS:
+                    break
+                ( urlRows, _ ) = self.historian.sampleSeedSlot( blockStart, slot )
+                if not urlRows:
+                    break
+
+            url = urlRows.pop( self.rng.randrange( len( urlRows ) ) )[ 'url' ]
+            self.addEvent( ts, url, self.handlerName( url ) )
+            ts += abs( secPerUrl + self.rng.choice( [ -1, 1 ] ) * self.rng.uniform( 0, secPerUrl / 4 ) )
+
+    def export( self, filename ):
+        """
+        Write the timeline to a CSV plan file in time order
+        """
+        with open( filename, 'w', newline = '' ) as planFile:
+            writer = csv.writer( planFile )
+            writer.writerow( self.PLAN_COLUMNS )
+            for ( ts, seq, url, handler ) in sorted( self.events ):
+                writer.writerow( [ datetime.fromtimestamp( ts ).isoformat( sep = ' ', timespec = 'seconds' ), url,
+                                   handler ] )
+
+        self.log( 'Exported %d planned visits to %s' % ( len( self.events ), filename ) )
+
+    def load( self, filename ):
+        """
+        Read a CSV plan file into the timeline
+        """
+        with open( filename, newline = '' ) as planFile:
+            for row in csv.DictReader( planFile ):
+                self.addEvent( datetime.fromisoformat( row[ 'timestamp' ] ).timestamp( ), row[ 'url' ],
+                               row.get( 'handler', '' ) )
+
+        self.log( 'Loaded %d planned visits from %s' % ( len( self.events ), filename ) )
+
+    def run( self, handleUrl, idle = time.sleep ):
+        """
+        Execute the timeline in time order. Waits are measured against each event's absolute time,
+        so slow visits never shift later events. Events more than LATE_GRACE_SEC late are moved to
+        a random time in the rest of their half-hour block, or dropped once that block is over
+        """
+        stats = { 'visited': 0, 'rescheduled': 0, 'dropped': 0 }
+        while self.events:
+            ( ts, seq, url, handler ) = self.events[ 0 ]
+            wait = ts - time.time( )
+            if wait > 0:
+                idle( wait )
+                continue
+
+            heapq.heappop( self.events )
+            now = time.time( )
+            if now - ts > self.LATE_GRACE_SEC:
+                blockEnd = self.blockStart( ts ) + self.BLOCK_SEC
+                if now < blockEnd:
+                    self.addEvent( self.rng.uniform( now, blockEnd ), url, handler )
+                    stats[ 'rescheduled' ] += 1
+                else:
+                    stats[ 'dropped' ] += 1
+                continue
+
+            handleUrl( url )
+            stats[ 'visited' ] += 1
+
+        self.log( 'Finished plan: %(visited)d visited, %(rescheduled)d rescheduled, %(dropped)d dropped' % stats )
+
+        return stats
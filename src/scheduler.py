@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import threading
+import contextvars
+import concurrent.futures
+
+import dblog
+
+# context of the browsing session a coroutine or executor call belongs to, None outside of one
+SESSION_CONTEXT = contextvars.ContextVar( 'session', default = None )
+
+class scheduler( object ):
+    """
+    asyncio core that multiplexes browsing sessions on one event loop thread. Sessions are coroutines,
+    every idle is a timer on the loop, and blocking webdriver work runs on a small shared executor
+    """
+    def __init__( self, callThreads ):
+        self.executor = concurrent.futures.ThreadPoolExecutor( max_workers = callThreads,
+                                                               thread_name_prefix = 'session-call' )
+        self.stopping = None
+        self.loop = None
+        self.thread = None
+
+    def log( self, msg, level = logging.INFO ):
+        """
+        Shortcut to DB's logger
+        """
+        dblog.log( 'sched', msg, level = level )
+
+    def start( self ):
+        """
+        Start the event loop on its own thread
+        """
+        self.loop = asyncio.new_event_loop( )
+        self.thread = threading.Thread( target = self.loop.run_forever, name = 'scheduler', daemon = True )
+        self.thread.start( )
+        self.stopping = self.create( asyncio.Event )
+
+    def stopSessions( self ):
+        """
+        Tell sessions to stop, waking any that are idle
+        """
+        self.loop.call_soon_threadsafe( self.stopping.set )
+
+    def isStopping( self ):
+        """
+        True once stopSessions has been called
+        """
+        return self.stopping.is_set( )
+
+    def stop( self ):
+        """
+        Stop the event loop and wait for running executor calls
+        """
+        self.loop.call_soon_threadsafe( self.loop.stop )
+        self.thread.join( )
+        self.loop.close( )
+        self.executor.shutdown( wait = True )
+
+    def submit( self, coro ):
+        """
+        Schedule a coroutine on the event loop from another thread, returns a concurrent.futures.Future of its result
+        """
+        return asyncio.run_coroutine_threadsafe( coro, self.loop )
+
+    def create( self, factory, *args ):
+        """
+        Build an asyncio object on the event loop, so it's bound to that loop on every python version
+        """
+        async def build( ):
+            return factory( *args )
+
+        return self.submit( build( ) ).result( )
+
+    async def idle( self, seconds ):
+        """
+        Wait without holding a thread, returns early when sessions are stopped
+        """
+        try:
+            await asyncio.wait_for( self.stopping.wait( ), seconds )
+        except asyncio.TimeoutError:
+            pass
+
+    async def call( self, func, *args ):
+        """
+        Run a blocking func on the executor, in the running session's context
+        """
+        return await self.loop.run_in_executor( self.executor, contextvars.copy_context( ).run, func, *args )
+
+    def enter( self, context ):
+        """
+        Event loop: make context the session of the running coroutine and of the executor calls it makes
+        """
+        SESSION_CONTEXT.set( context )
+
+    def context( self ):
+        """
+        The session context of the running coroutine or executor call, None outside of one
+        """
+        return SESSION_CONTEXT.get( )
@@ -0,0 +1,194 @@
+import time
+import logging
+
+import dblog
+import datamgr
+
+# numpy is optional, without it seed data is queried from the seed rollups
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class seedengine( object ):
+    """
+    In-memory seed data, loaded once into numpy arrays so seeding the browsing loop does no database I/O.
+    Built from all of the working history like the seed rollups, so both engines seed the same urls and rates
+    """
+    # number of day-of-week / half-hour buckets
+    DAYS_OF_WEEK = 7
+    HALF_HOURS = 48
+
+    # select the working history rows as plain integers, day is the julian day number
+    SQL_SELECT_HISTORY = '''
+        SELECT H.url_id,
+            H.day_of_week,
+            H.half_hour,
+            H.visit_count,
+            CAST( julianday( date( H.timestamp ) ) AS INTEGER )
+        FROM history H
+        '''
+
+    # select url text for a set of url ids, '%s' is filled with placeholders
+    SQL_SELECT_URLS = 'SELECT id, url FROM urls WHERE id IN ( %s )'
+
+    # max host parameters per url lookup, below SQLite's default limit
+    URL_BATCH_SIZE = 500
+
+    def __init__( self, maxResults ):
+        self.maxResults = maxResults
+        self.dayRows = [ [ ] for _ in range( self.DAYS_OF_WEEK ) ]
+        self.halfHourRows = [ [ ] for _ in range( self.HALF_HOURS ) ]
+        self.dayTotals = None
+        self.halfHourTotals = None
+
+    @staticmethod
+    def available( ):
+        """
+        True if numpy can be imported
+        """
+        return numpy is not None
+
+    def log( self, msg, level = logging.INFO ):
+        """
+        Shortcut to DB's logger
+        """
+        dblog.log( 'seed', msg, level = level )
+
+    def load( self, dataMgr ):
+        """
+        Load the working history into arrays and pre-compute the top urls and visit totals of every bucket
+        """
+        tick = time.time( )
+        cols = self.fetchHistory( dataMgr )
+        self.log( 'Loaded %d history rows in %.2fs' % ( len( cols ), time.time( ) - tick ) )
+
+        urlIds, urls = numpy.unique( cols[ :, 0 ], return_inverse = True )
+        counts = cols[ :, 3 ]
+        days = cols[ :, 4 ] - cols[ :, 4 ].min( ) if len( cols ) else cols[ :, 4 ]
+        numDays = int( days.max( ) ) + 1 if len( days ) else 1
+
+        ( dayTop, self.dayTotals ) = self.bucketTables( cols[ :, 1 ], self.DAYS_OF_WEEK, urls, len( urlIds ),
+                                                        counts, days, numDays )
+        ( halfTop, self.halfHourTotals ) = self.bucketTables( cols[ :, 2 ], self.HALF_HOURS, urls, len( urlIds ),
+                                                              counts, days, numDays )
+
+        # only the url text of urls that can be seeded is kept in memory
+        neededIds = set( )
+        for top in dayTop + halfTop:
+            neededIds.update( int( urlIds[ urlIdx ] ) for urlIdx in top[ 0 ] )
+        urlText = self.fetchUrls( dataMgr, neededIds )
+
+        self.dayRows = [ self.seedRows( top, urlIds, urlText ) for top in dayTop ]
+        self.halfHourRows = [ self.seedRows( top, urlIds, urlText ) for top in halfTop ]
+        self.log( 'Built seed buckets for %d urls in %.2fs' % ( len( urlIds ), time.time( ) - tick ) )
+
+    def fetchHistory( self, dataMgr ):
+        """
+        Fetch the history rows in batches into an ( n, 5 ) int64 array
+        """
+        curs = dataMgr.conn( ).cursor( )
+        curs.row_factory = None
+        curs.execute( self.SQL_SELECT_HISTORY )
+
+        batches = [ numpy.empty( ( 0, 5 ), dtype = numpy.int64 ) ]
+        while True:
+            rows = curs.fetchmany( datamgr.datamgr.IMPORT_BATCH_SIZE )
+            if not rows:
+                break
+            batches.append( numpy.array( rows, dtype = numpy.int64 ) )
+        curs.close( )
+
+        return numpy.concatenate( batches )
+
+    def fetchUrls( self, dataMgr, urlIds ):
+        """
+        Returns a dict of url id to url text
+        """
+        urlIds = sorted( urlIds )
+        curs = dataMgr.conn( ).cursor( )
+        curs.row_factory = None
+        urlText = { }
+        for i in range( 0, len( urlIds ), self.URL_BATCH_SIZE ):
+            batch = urlIds[ i:i + self.URL_BATCH_SIZE ]
+            curs.execute( self.SQL_SELECT_URLS % ','.join( '?' * len( batch ) ), batch )
+            urlText.update( curs.fetchall( ) )
+        curs.close( )
+
+        return urlText
+
+    def bucketTables( self, buckets, numBuckets, urls, numUrls, counts, days, numDays ):
+        """
+        For every bucket, returns the indexes, visit counts and distinct-day counts of its most visited urls,
+        along with an array of ( total visits, distinct days ) per bucket
+        """
+        # aggregate visits and distinct days per ( bucket, url ) pair
+        ( pairs, pairIdx ) = numpy.unique( buckets * numUrls + urls, return_inverse = True )
+        pairVisits = numpy.bincount( pairIdx, weights = counts, minlength = len( pairs ) )
+        pairDays = numpy.bincount( numpy.unique( pairIdx * numDays + days ) // numDays, minlength = len( pairs ) )
+        pairBuckets = pairs // numUrls
+
+        # order by bucket, then most visited first with ties by url id descending like the seed rollup
+        # queries, and slice the top of each bucket
+        order = numpy.lexsort( ( -( pairs % numUrls ), -pairVisits, pairBuckets ) )
+        bucketIdx = numpy.arange( numBuckets )
+        starts = numpy.searchsorted( pairBuckets[ order ], bucketIdx, side = 'left' )
+        ends = numpy.minimum( numpy.searchsorted( pairBuckets[ order ], bucketIdx, side = 'right' ),
+                              starts + self.maxResults )
+        tops = [ ]
+        for ( start, end ) in zip( starts, ends ):
+            top = order[ start:end ]
+            tops.append( ( pairs[ top ] % numUrls, pairVisits[ top ], pairDays[ top ] ) )
+
+        # bucket totals, days are distinct per bucket
+        totalVisits = numpy.bincount( buckets, weights = counts, minlength = numBuckets )
+        totalDays = numpy.bincount( numpy.unique( buckets * numDays + days ) // numDays, minlength = numBuckets )
+
+        return tops, numpy.stack( ( totalVisits, totalDays ), axis = 1 )
+
+    def seedRows( self, top, urlIds, urlText ):
+        """
+        Convert a bucket's top urls into rows shaped like the seed rollup queries' results
+        """
+        rows = [ ]
+        for ( urlIdx, visits, days ) in zip( *top ):
+            urlId = int( urlIds[ urlIdx ] )
+            rows.append( {
+                'url': urlText.get( urlId ),
+                'url_id': urlId,
+                'visit_count': int( visits ),
+                'day_count': int( days ),
+                'guidCount': int( visits )
+            } )
+
+        return rows
+
+    def getDoWUrlData( self, dayOfWeek ):
+        """
+        Returns the most visited urls for a day of week (0-6 from Sunday)
+        """
+        return list( self.dayRows[ dayOfWeek ] )
+
+    def getHalfHrlyUrlData( self, halfHour ):
+        """
+        Returns the most visited urls for a 0-47 half-hour block
+        """
+        return list( self.halfHourRows[ halfHour ] )
+
+    def getBucketRate( self, duration, dayOfWeek, halfHour ):
+        """
+        For a bucket, determine about how many URLs per time period are visited
+        on the days that had any visits in that bucket
+        """
+        anyBucket = datamgr.datamgr.SEED_ROLLUP_ANY
+        if halfHour == anyBucket:
+            ( visits, days ) = self.dayTotals[ dayOfWeek ]
+        elif dayOfWeek == anyBucket:
+            ( visits, days ) = self.halfHourTotals[ halfHour ]
+        else:
+            return 0
+
+        if not days:
+            return 0
+
+        return round( float( visits / days ) / duration, 2 )
@@ -5,6 +5,7 @@ import dblog
 # libs
 import time
 import random
+import asyncio
 import string
 from datetime import datetime
 import dateutil.parser
@@ -21,10 +22,21 @@ class user( ):
     def __init__( self, typingWpm=conf.conf.OPTION_TYPING_WPM_DEFAULT, typingRand=conf.conf.OPTION_TYPING_ERR_DEFAULT ):
         self.typingWpm = float( typingWpm )
         self.typingRand = float( typingRand )
+        self.scheduler = None
 
-    def idle( self, seconds ):
+    async def idle( self, seconds ):
         """
-        Sleep for a given duration (in seconds)
+        Idle for a given duration (in seconds) without holding a thread,
+        a scheduled session's idles end early once its scheduler stops the sessions
+        """
+        if self.scheduler and self.scheduler.context( ) is not None:
+            await self.scheduler.idle( seconds )
+        else:
+            await asyncio.sleep( seconds )
+
+    def wait( self, seconds ):
+        """
+        Block the calling thread for a given duration (in seconds), for pacing outside of a url's handling
         """
         time.sleep( seconds )
 
@@ -35,22 +47,22 @@ class user( ):
         diffSec  = round(diff.total_seconds(),0)
         if diffSec > 0:
             dblog.log('wait','Waiting %s before starting, resuming at %s' % ( diff, startDtm ) )
-            self.idle( diffSec )
+            self.wait( diffSec )
             dblog.log('wait','Finished waiting, target time = %s' % ( diff, startDtm ) )
 
-    def pause( self ):
+    async def pause( self ):
         """
         Uses 3 react()s for a semi-random pause
         """
-        self.react( )
-        self.react( )
-        self.react( )
+        await self.react( )
+        await self.react( )
+        await self.react( )
 
-    def react( self ):
+    async def react( self ):
         """
-        Sleeps for the duration of a reactionSec()
+        Idles for the duration of a reactionSec()
         """
-        self.idle( self.reactionSec( ) )
+        await self.idle( self.reactionSec( ) )
 
     def reactionSec( self ):
         """
@@ -59,10 +71,10 @@ class user( ):
         random.seed( )
         return random.uniform( .1, .5 )
 
-    def reactKeyPress( self, speed=None ):
+    async def reactKeyPress( self, speed=None ):
         if not speed:
             speed = self.typingWpm
-        self.idle( self.postKeyPause( speed ) )
+        await self.idle( self.postKeyPause( speed ) )
 
     def perterb( self ):
         """
@@ -98,9 +110,10 @@ class user( ):
             sloppy += c
         return sloppy
 
-    def typeKeys( self, db, inputElem, text, sloppify = True, enableDrunkRate = False ):
+    async def typeKeys( self, db, inputElem, text, sloppify = True, enableDrunkRate = False ):
         """
-        Types keys as if the user did it themselves, also has fuzz-factor
+        Types keys as if the user did it themselves, also has fuzz-factor.
+        Key presses are blocking browser calls made through db.call
         """
         errRate = self.typingRand
         speedWpm = self.typingWpm
@@ -117,8 +130,8 @@ class user( ):
 
         # send each character and wait a fuzzed duration
         for c in text:
-            inputElem.send_keys( c )
-            self.reactKeyPress( speedWpm )
+            await db.call( inputElem.send_keys, c )
+            await self.reactKeyPress( speedWpm )
 
     def insideDrunkTimeFrame( self ):
         """